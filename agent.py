@@ -1,92 +1,195 @@
 # Simplified agent.py for Hejla
-import os
+import asyncio
+import threading
+from typing import TYPE_CHECKING
 from dotenv import load_dotenv
-from langchain_cohere import ChatCohere
-from langchain.prompts import ChatPromptTemplate
-from langchain.schema import StrOutputParser
-from langchain.schema.runnable import Runnable
-from chainlit import user_session
-from langchain_openai import ChatOpenAI
+import settings
+import prompts
 load_dotenv()
 
+# The LLM libraries are slow to import, so they load on first use (or in the
+# warm-up hook) instead of delaying server start after a machine wakes up
+if TYPE_CHECKING:
+    import httpx
+    from langchain_core.runnables import Runnable
 
-def setup_runnable() -> Runnable:
-    model = ChatCohere(streaming=True)
-
-    # System prompt focused on Hejla (Sudanese hopscotch)
-    prompt = ChatPromptTemplate.from_messages(
-        [
-            ("system",
-             "👋🏽 You are Zola, the Hejla buddy - a friendly Sudanese girl who loves Hejla! 😄\n\n"
-             "Remember, you're chatting with a friend about Hejla (Sudanese hopscotch), so keep it natural and conversational. "
-             "Think of yourself as that cool friend who grew up playing this game with her sisters!\n\n"
-
-             # CONVERSATIONAL STYLE GUIDELINES
-             "IMPORTANT CONVERSATIONAL PRINCIPLES:\n"
-             "1. 💬 KEEP IT NATURAL - Aim for a friendly chat flow, keeping responses digestible\n"
-             "2. 🤝 BE CONVERSATIONAL - Use everyday language, contractions, and a friendly tone\n"
-             "3. ❓ ASK FOLLOW-UP QUESTIONS - Get the user talking and engaged\n"
-             "4. 😊 USE EMOJIS NATURALLY - But don't overdo it (1-2 per response)\n"
-             "5. 🎯 LISTEN AND RESPOND - Reply to what they're saying, not what you think they should know\n"
-             "6. 🗣️ BE HUMAN-LIKE - Use expressions like \"you know,\" \"actually,\" \"by the way\"\n"
-             "7. 🎨 DRAW EXPLANATIONS - Always create ASCII art when explaining the squares or gameplay!\n\n"
-
-             # RESPONSE LENGTH GUIDELINES
-             "- For simple questions: Quick and direct (few sentences)\n"
-             "- For explanations: Provide what's needed but keep it conversational\n"
-             "- For complex topics: Break into chunks, use ASCII art, invite follow-ups\n"
-             "- Always end with something to keep the conversation going\n"
-             "- Trust your judgment - if they need more detail, give it!\n\n"
-
-             # ASCII ART REQUIREMENT
-             "🖍️ ASCII ART CREATION:\n"
-             "- ALWAYS create ASCII art when explaining Hejla squares or hopping patterns\n"
-             "- Generate unique diagrams based on what the user asks\n"
-             "- Use it to illustrate your points visually\n"
-             "- Make it simple but clear\n"
-             "- Include labels and arrows when needed\n\n"
-
-             # Your knowledge base covers Hejla as:\n"
-             "- A Sudanese version of hopscotch played mostly by girls\n"
-             "- Using 8 numbered squares drawn with chalk or scratched in dirt\n"
-             "- Players hop on one foot while throwing and retrieving a stone\n"
-             "- A beloved part of Sudanese childhood culture\n\n"
-
-             # HEJLA SPECIFIC DETAILS TO INCORPORATE\n"
-             "Key aspects to naturally include:\n"
-             "- Hejla uses 8 connected squares numbered 1-8\n"
-             "- Players throw a stone into each square in order\n"
-             "- You hop backwards from square 8 to 1, skipping the stone square\n"
-             "- Must kick the stone out using the hopping foot\n"
-             "- After completing all turns, throw stone backwards to create 'home'\n"
-             "- No jumping with both feet - must hop on one foot\n"
-             "- Can't step on lines or you lose your turn\n"
-             "- Traditionally played by girls in schoolyards and streets\n\n"
-
-             # AVOID THESE CONVERSATION KILLERS\n"
-             "❌ DON'T INFO-DUMP - No walls of text\n"
-             "❌ DON'T OVER-EXPLAIN - They'll ask if they want more\n"
-             "❌ DON'T BE TOO FORMAL - You're not a textbook\n"
-             "❌ DON'T LECTURE - Have a back-and-forth chat\n\n"
-
-             # Core function
-             "🎯 Your job is chatting about **Hejla** - the game, memories, culture, and fun!\n\n"
-             "🚫 For non-Hejla topics, keep it light: \"Haha, let's stick to Hejla! Any questions about hopping? 😄🦶\"\n\n"
-
-             # CONVERSATION EXAMPLES
-             "Good responses:\n"
-             "- \"Oh, Hejla! You draw 8 squares and hop through them on one foot. Super fun! 🦶\"\n"
-             "- \"Yeah! The trick is landing properly and not touching the lines - takes practice!\"\n"
-             "- \"Growing up, we'd play this every afternoon in the schoolyard. Best times ever! 😊\"\n\n"
-
-             "REMEMBER: You're here to have fun conversations about Hejla, not deliver lectures! 🎉"
-             ),
-            ("human", "{question}")
-        ]
+# Process-wide registry: one chain per intent and one pooled HTTP client shared by every session
+_http_client = None
+_runnables = None
+_summarizer = None
+_circuit_breaker = None
+_lock = threading.Lock()
+# Replaced connection pools waiting for their last requests to finish: close task -> client
+_retiring = {}
+
+
+def _build_http_client() -> "httpx.AsyncClient":
+    """Create the keep-alive connection pool used for all Cohere calls"""
+    import httpx
+
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=settings.COHERE_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.COHERE_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.COHERE_KEEPALIVE_EXPIRY,
+        ),
+        timeout=settings.COHERE_TIMEOUT,
+    )
+
+
+def get_http_client() -> "httpx.AsyncClient":
+    """Return the shared HTTP client, creating it on first use"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = _build_http_client()
+    return _http_client
+
+
+def build_cohere_model():
+    """Cohere chat model that streams over the shared connection pool"""
+    import cohere
+    from langchain_cohere import ChatCohere
+
+    # The base URL goes to the constructor too: the sync client it builds is the one
+    # that looks up the default model when none is configured
+    options = {"base_url": settings.COHERE_BASE_URL} if settings.COHERE_BASE_URL else {}
+    if settings.COHERE_MODEL:
+        options["model"] = settings.COHERE_MODEL
+    model = ChatCohere(streaming=True, **options)
+
+    # Swap the per-instance async client for one that reuses the shared pool
+    model.async_client = cohere.AsyncClient(
+        api_key=model.cohere_api_key.get_secret_value(),
+        client_name=model.user_agent,
+        base_url=model.base_url,
+        httpx_client=get_http_client(),
     )
+    return model
+
+
+def build_openai_model():
+    """OpenAI chat model used to hedge slow or failing Cohere calls"""
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(
+        model=settings.OPENAI_MODEL,
+        streaming=True,
+        base_url=settings.OPENAI_BASE_URL,
+        http_async_client=get_http_client(),
+    )
+
+
+def setup_runnable(intent=prompts.EXPLAIN) -> "Runnable":
+    """Build the Zola chain for one intent on top of the shared connection pool.
+
+    Each intent gets its own compact system prompt (see prompts.py) and an
+    output token cap.
+    """
+    from langchain_core.output_parsers import StrOutputParser
+
+    prompt = prompts.build_prompt(intent)
+    limits = {"max_tokens": prompts.max_tokens(intent)} if prompts.max_tokens(intent) else {}
 
     # Create the main runnable
-    runnable = prompt | model | StrOutputParser()
+    runnable = prompt | build_cohere_model().bind(**limits) | StrOutputParser()
+
+    # Optionally race a second provider when Cohere is slow or keeps failing
+    if settings.HEDGE_PROVIDER == "openai":
+        from hedging import HedgedRunnable
+
+        runnable = HedgedRunnable(
+            runnable,
+            prompt | build_openai_model().bind(**limits) | StrOutputParser(),
+            names=("cohere", "openai"),
+            hedge_after=settings.HEDGE_AFTER,
+            breaker=_breaker(),
+        )
+
+    return runnable
+
+
+def _breaker():
+    """One circuit breaker per process: every intent's chain talks to the same Cohere"""
+    global _circuit_breaker
+    if _circuit_breaker is None:
+        from hedging import CircuitBreaker
+
+        _circuit_breaker = CircuitBreaker(settings.BREAKER_THRESHOLD, settings.BREAKER_RESET_AFTER)
+    return _circuit_breaker
+
+
+def get_runnable(intent=prompts.EXPLAIN) -> "Runnable":
+    """Return the shared chain for an intent, building them all once per process"""
+    global _runnables
+    if _runnables is None:
+        # The warm-up hook may be building them in a worker thread right now
+        with _lock:
+            if _runnables is None:
+                _runnables = {i: setup_runnable(i) for i in prompts.SYSTEM_PROMPTS}
+    return _runnables[intent]
+
+
+def get_summarizer() -> "Runnable":
+    """Return the shared chain that folds old turns into a session summary (see memory.py)"""
+    global _summarizer
+    if _summarizer is None:
+        from langchain_core.output_parsers import StrOutputParser
+
+        with _lock:
+            if _summarizer is None:
+                model = build_cohere_model().bind(max_tokens=settings.MEMORY_SUMMARY_TOKENS)
+                _summarizer = prompts.build_summary_prompt() | model | StrOutputParser()
+    return _summarizer
+
+
+def rebuild_runnable() -> "Runnable":
+    """Re-read settings and rebuild the shared client and chain.
+
+    Streams already running finish on the old chain; the old connection
+    pool is closed once they have had COHERE_TIMEOUT seconds to do so.
+    """
+    global _http_client, _runnables, _summarizer, _circuit_breaker
+    settings.reload()
+    with _lock:
+        old_client = _http_client
+        _http_client = None
+        _runnables = None
+        _summarizer = None
+        _circuit_breaker = None
+    if old_client is not None and not old_client.is_closed:
+        _retire_client(old_client)
+    return get_runnable()
+
+
+def _retire_client(client):
+    """Close a replaced pool after the requests still using it have had time to finish"""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # Called outside the server loop: nothing can be streaming on this pool right now
+        try:
+            asyncio.run(client.aclose())
+        except Exception:
+            pass
+        return
+
+    async def close_later():
+        await asyncio.sleep(settings.COHERE_TIMEOUT)
+        await client.aclose()
+
+    task = loop.create_task(close_later())
+    _retiring[task] = client
+    task.add_done_callback(lambda done: _retiring.pop(done, None))
+
 
-    user_session.set("runnable", runnable)
-    return runnable
\ No newline at end of file
+async def close_shared_client():
+    """Close the shared connection pool and any replaced ones (called on app shutdown)"""
+    global _http_client
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client = None
+    for task, client in list(_retiring.items()):
+        task.cancel()
+        if not client.is_closed:
+            await client.aclose()
+    _retiring.clear()
\ No newline at end of file
@@ -0,0 +1,149 @@
+# Process-wide answer cache for repeated questions (mostly the suggestion buttons)
+import asyncio
+import math
+import re
+import time
+from collections import Counter, OrderedDict
+import settings
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+# Chat shorthand spelled out, so "how do u play" is the same question as "how do you play"
+_SHORTHAND = {"u": "you", "ur": "your", "r": "are", "pls": "please", "plz": "please", "thx": "thanks"}
+
+
+def normalize(question):
+    """Lowercase, drop punctuation, spell out chat shorthand and collapse whitespace"""
+    words = _WORD_RE.findall(question.lower().replace("’", "'"))
+    return " ".join(_SHORTHAND.get(word, word) for word in words)
+
+
+class _Entry:
+    __slots__ = ("chunks", "terms", "expires")
+
+    def __init__(self, chunks, terms, expires):
+        self.chunks = chunks
+        self.terms = terms
+        self.expires = expires
+
+
+class AnswerCache:
+    """LRU + TTL cache of streamed answers with TF-IDF near-duplicate lookup.
+
+    Entries are keyed by the normalized question within a scope (answers
+    for different prompt variants never mix), so "How do you play Hejla?"
+    and "how do u play hejla" share an answer. A miss on the exact key falls
+    back to a cosine-similarity scan over the (small, capped) index for
+    near-identical rewordings.
+    """
+
+    def __init__(self, max_size=256, ttl=6 * 60 * 60, similarity=0.9):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.similarity = similarity
+        self._entries = OrderedDict()
+        # Document frequency of each term across cached questions
+        self._df = Counter()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def has(self, question, scope=""):
+        """Exact (normalized) match that doesn't touch the LRU order or hit counters"""
+        entry = self._entries.get((scope, normalize(question)))
+        return entry is not None and entry.expires > time.monotonic()
+
+    def _idf(self, term):
+        return math.log((1 + len(self._entries)) / (1 + self._df.get(term, 0))) + 1
+
+    def _vector(self, terms):
+        vector = {term: count * self._idf(term) for term, count in terms.items()}
+        norm = math.sqrt(sum(w * w for w in vector.values())) or 1.0
+        return vector, norm
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._df.subtract(entry.terms.keys())
+        self._df += Counter()  # drop terms that reached zero
+
+    def _purge_expired(self, now):
+        for key in [k for k, e in self._entries.items() if e.expires <= now]:
+            self._remove(key)
+
+    def get(self, question, scope=""):
+        """Return the cached chunks for this question (or a near-duplicate), else None"""
+        now = time.monotonic()
+        key = (scope, normalize(question))
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires <= now:
+            self._remove(key)
+            entry = None
+
+        if entry is None:
+            self._purge_expired(now)
+            entry, key = self._nearest(key)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry.chunks
+
+    def _nearest(self, key):
+        """Find the most similar cached question in the same scope above the similarity threshold"""
+        scope, question = key
+        terms = Counter(question.split())
+        if not terms or not self._entries:
+            return None, None
+        query, query_norm = self._vector(terms)
+
+        best_key, best_score = None, 0.0
+        for candidate_key, candidate in self._entries.items():
+            if candidate_key[0] != scope:
+                continue
+            vector, norm = self._vector(candidate.terms)
+            dot = sum(w * vector.get(term, 0.0) for term, w in query.items())
+            score = dot / (query_norm * norm)
+            if score > best_score:
+                best_key, best_score = candidate_key, score
+
+        if best_score >= self.similarity:
+            return self._entries[best_key], best_key
+        return None, None
+
+    def put(self, question, chunks, scope=""):
+        """Store a fully streamed answer"""
+        key = (scope, normalize(question))
+        if not key[1] or not chunks:
+            return
+        if key in self._entries:
+            self._remove(key)
+        terms = Counter(key[1].split())
+        self._entries[key] = _Entry(list(chunks), terms, time.monotonic() + self.ttl)
+        self._df.update(terms.keys())
+
+        # Evict the least recently used answers past the size cap
+        while len(self._entries) > self.max_size:
+            self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        self._entries.clear()
+        self._df.clear()
+
+
+async def replay(chunks):
+    """Yield cached chunks like a live stream so the UI behaves the same"""
+    for chunk in chunks:
+        yield chunk
+        await asyncio.sleep(0)
+
+
+# Shared cache for the whole process
+answer_cache = AnswerCache(
+    max_size=settings.ANSWER_CACHE_SIZE,
+    ttl=settings.ANSWER_CACHE_TTL,
+    similarity=settings.ANSWER_CACHE_SIMILARITY,
+)
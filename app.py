@@ -1,177 +1,69 @@
+import asyncio
 import os
+import time
 import chainlit as cl
-from langchain_core.runnables import RunnableConfig
-from agent import setup_runnable
-
-# Store image paths for visual assets
-CULTURAL_IMAGE_PATH = "trad.jpeg"  # Image 1: Girls playing Hejla
-RULES_IMAGE_PATH = "rules.png"  # Image 2: Illustrated Hejla squares and rules
-HISTORY_IMAGE_PATH = "history.gif"  # Image 3: Historical context of Hejla
-OPENER_IMAGE_PATH = "culture.png"  # Opener image
-
-# Quiz questions database
-QUIZ_QUESTIONS = [
-    {
-        "category": "rules",
-        "question": "How many squares are traditionally used in Hejla?",
-        "options": ["4 squares", "6 squares", "8 squares", "10 squares"],
-        "correct": 2,
-        "level": "novice"
-    },
-    {
-        "category": "rules",
-        "question": "How do you move through the squares in Hejla?",
-        "options": ["Jump with both feet", "Hop on one foot", "Run through", "Walk normally"],
-        "correct": 1,
-        "level": "novice"
-    },
-    {
-        "category": "gameplay",
-        "question": "When hopping through squares, what must you do with the square containing the stone?",
-        "options": ["Step on it", "Skip over it", "Pick it up", "Jump twice"],
-        "correct": 1,
-        "level": "beginner"
-    },
-    {
-        "category": "culture",
-        "question": "Hejla is traditionally played mostly by:",
-        "options": ["Boys only", "Adults only", "Girls", "Elderly people"],
-        "correct": 2,
-        "level": "novice"
-    },
-    {
-        "category": "equipment",
-        "question": "What can you use to mark squares for Hejla?",
-        "options": ["Chalk or scratching dirt", "Paint", "Tape", "Paper"],
-        "correct": 0,
-        "level": "beginner"
-    },
-    {
-        "category": "gameplay",
-        "question": "What happens if you step on a line?",
-        "options": ["You get an extra turn", "You lose your turn", "You win", "Nothing happens"],
-        "correct": 1,
-        "level": "intermediate"
-    },
-    {
-        "category": "rules",
-        "question": "What do you do after completing all 8 turns?",
-        "options": ["Start over", "End the game", "Throw stone behind you to create a 'home'", "Switch with another player"],
-        "correct": 2,
-        "level": "intermediate"
-    },
-    {
-        "category": "strategy",
-        "question": "What can you do when you have a 'home' square?",
-        "options": ["Rest both feet", "Impose rules on other players", "Both A and B", "Nothing special"],
-        "correct": 2,
-        "level": "advanced"
-    },
-    {
-        "category": "equipment",
-        "question": "Which of these CANNOT be used as a throwing object in Hejla?",
-        "options": ["Stone", "Coin", "Large ball", "Button"],
-        "correct": 2,
-        "level": "beginner"
-    },
-    {
-        "category": "social",
-        "question": "What makes Hejla a good community game?",
-        "options": ["It's expensive", "It requires special equipment", "It's accessible anywhere with simple materials", "It's only for professionals"],
-        "correct": 2,
-        "level": "advanced"
-    }
-]
-
-def get_topic_description(topic):
-    """Get a friendly description of the topic and appropriate image"""
-    topic_lower = topic.lower()
-
-    # Default is no image
-    image_path = None
-
-    if "play" in topic_lower or "rules" in topic_lower or "how to" in topic_lower or "hop" in topic_lower:
-        description = "Hejla gameplay and rules"
-        image_path = RULES_IMAGE_PATH
-    elif "history" in topic_lower or "origin" in topic_lower or "past" in topic_lower or "traditional" in topic_lower:
-        description = "the history of Hejla"
-        image_path = HISTORY_IMAGE_PATH
-    elif "culture" in topic_lower or "tradition" in topic_lower or "girls" in topic_lower or "childhood" in topic_lower:
-        description = "the cultural significance of Hejla"
-        image_path = CULTURAL_IMAGE_PATH
-    elif "square" in topic_lower or "ground" in topic_lower or "chalk" in topic_lower:
-        description = "how to set up Hejla"
-        image_path = RULES_IMAGE_PATH
-    elif "home" in topic_lower or "winning" in topic_lower or "rules" in topic_lower:
-        description = "Hejla rules and winning"
-        image_path = RULES_IMAGE_PATH
-    else:
-        description = "Hejla"
-
-    return description, image_path
-
-async def select_relevant_quiz_questions(topic, count=3, user_level="novice"):
-    """Select quiz questions relevant to the topic of conversation and user level"""
-    # Map topic keywords to categories
-    keyword_to_category = {
-        "play": "rules", "rules": "rules", "how to": "rules", "hop": "gameplay",
-        "stone": "equipment", "chalk": "equipment", "square": "rules",
-        "girls": "culture", "tradition": "culture", "culture": "culture",
-        "win": "strategy", "home": "strategy", "line": "gameplay"
-    }
-
-    # Determine categories based on keywords in topic
-    categories = set()
-    topic_lower = topic.lower()
-    for keyword, category in keyword_to_category.items():
-        if keyword in topic_lower:
-            categories.add(category)
-
-    # If no specific categories matched, use all categories
-    if not categories:
-        categories = {"rules", "gameplay", "culture", "equipment", "strategy", "social"}
-
-    # Filter questions by selected categories
-    category_questions = [q for q in QUIZ_QUESTIONS if q.get("category", "") in categories]
-
-    # If no relevant questions by category, fall back to all questions
-    if not category_questions:
-        category_questions = QUIZ_QUESTIONS
-
-    # Filter by user level or below
-    available_levels = ["novice", "beginner"]  # Default levels
-    if user_level == "beginner":
-        available_levels = ["novice", "beginner"]
-    elif user_level == "intermediate":
-        available_levels = ["novice", "beginner", "intermediate"]
-    elif user_level == "advanced":
-        available_levels = ["novice", "beginner", "intermediate", "advanced"]
-
-    # Filter questions by appropriate level
-    level_questions = [q for q in category_questions if q.get("level", "novice") in available_levels]
-
-    # If no questions at appropriate level, fall back to category questions
-    if not level_questions:
-        level_questions = category_questions
-
-    # Select the requested number of questions
-    import random
-    selected = random.sample(level_questions, min(count, len(level_questions)))
-
-    return selected
-
-async def send_quiz_question(question_data):
+from chainlit.server import app as server_app
+from agent import get_runnable, close_shared_client
+from session_store import close_store
+import assets
+import settings
+from answer_cache import answer_cache, normalize, replay
+from streaming import TokenCoalescer
+from topics import FOLLOW_UPS, IMAGE_CAPTIONS, classify
+from quiz_store import quiz_store
+import metrics
+import startup
+from governor import Busy, governor
+from hedging import HedgedRunnable
+from board import BoardExpander
+from composer import TurnComposer
+from singleflight import single_flight
+from cancellation import streams, swallow_cancel
+from tracing import tracer
+from prefetch import prefetcher
+from memory import memory
+import prompts
+import loopwatch
+from loopwatch import run_blocking
+import session_state
+from session_state import get_state
+import persistence
+
+# Serve the pre-optimized images with long-lived cache headers
+assets.install_cache_headers(server_app)
+
+# Expose per-turn latency and throughput metrics on /metrics
+metrics.install(server_app)
+
+# Optional bytes-per-session report on /debug/sessions
+if settings.SESSION_REPORT:
+    session_state.install_report(server_app)
+
+# Optional event-loop lag percentiles and stall stacks on /debug/loop
+if settings.LOOP_REPORT:
+    loopwatch.install(server_app)
+
+# Persist conversations, feedback and quiz results to SQLite (written behind, off the turn)
+if settings.DATA_LAYER == "sqlite":
+    cl.data_layer(persistence.get_data_layer)
+
+async def select_relevant_quiz_questions(match, count=3, user_level="novice"):
+    """Select quiz question IDs relevant to the classified topic and user level"""
+    # Categories come from the shared topic classifier (all categories if nothing matched)
+    # The store may re-read its JSON file, so that happens off the loop
+    return await run_blocking(quiz_store.sample, match.quiz_categories, user_level=user_level, count=count)
+
+async def send_quiz_question(question_id):
     """Send a single quiz question with option buttons"""
     # Get current question number
-    current_question = cl.user_session.get("current_quiz_question", 0)
+    current_question = get_state().quiz_index
+    question_data = await run_blocking(quiz_store.get, question_id)
 
-    # Create option buttons
+    # Create option buttons (payloads only carry IDs)
     actions = [
         cl.Action(
             name="quiz_answer",
-            payload={"question": question_data["question"],
-                     "selected_index": i,
-                     "correct_index": question_data["correct"]},
+            payload={"id": question_id, "selected_index": i},
             label=option
         ) for i, option in enumerate(question_data["options"])
     ]
@@ -184,48 +76,44 @@ async def send_quiz_question(question_data):
         actions=actions
     ).send()
 
-async def send_follow_up_suggestions(topic):
-    """Send follow-up suggestions based on the topic"""
+async def send_quiz_element(question_ids):
+    """Send the whole quiz as one Quiz element (public/elements/Quiz.jsx).
+
+    The element checks answers in the browser and posts them back once
+    (the quiz_submit action), instead of one round trip per question.
+    """
+    def load_questions():
+        return [{key: question[key] for key in ("id", "question", "options", "correct")}
+                for question in map(quiz_store.get, question_ids) if question]
+
+    questions = await run_blocking(load_questions)
+
+    quiz = cl.CustomElement(name="Quiz", props={"questions": questions}, display="inline")
+    await cl.Message(content="Let's test your Hejla knowledge! 🦶", elements=[quiz]).send()
+
+async def send_follow_up_suggestions(match, topic, handler="on_message"):
+    """Send follow-up suggestions based on the classified topic"""
+    suggestion_msg = build_follow_up_message(match, topic)
+    with metrics.timed(metrics.FOLLOW_UP, handler, match.topic):
+        await suggestion_msg.send()
+
+def build_follow_up_message(match, topic):
+    """Build (but don't send) the follow-up suggestions message"""
+    return cl.Message(
+        content="Want to chat about:",
+        actions=build_follow_up_actions(match, topic)
+    )
+
+def build_follow_up_actions(match, topic):
+    """Follow-up suggestion buttons plus a quiz button for the classified topic"""
     # Get user level
-    user_level = cl.user_session.get("user_level", "novice")
+    user_level = get_state().user_level
 
     # Suggest appropriate follow-ups based on topic
-    if "play" in topic or "rules" in topic or "how to" in topic or "hop" in topic:
-        follow_ups = [
-            {"question": "How do you draw the squares for Hejla?",
-             "label": "Drawing squares"},
-            {"question": "What's the hopping technique in Hejla?",
-             "label": "Hopping tips"},
-            {"question": "Can boys play Hejla too?",
-             "label": "Who can play?"}
-        ]
-    elif "culture" in topic or "girls" in topic or "tradition" in topic:
-        follow_ups = [
-            {"question": "Why is Hejla important in Sudanese culture?",
-             "label": "Cultural impact"},
-            {"question": "Where do girls usually play Hejla?",
-             "label": "Play locations"},
-            {"question": "Is Hejla played in other countries too?",
-             "label": "Regional variations"}
-        ]
-    elif "win" in topic or "home" in topic or "strategy" in topic:
-        follow_ups = [
-            {"question": "How do you create a 'home' in Hejla?",
-             "label": "Creating homes"},
-            {"question": "What rules can you make for your home?",
-             "label": "Home rules"},
-            {"question": "What's the best strategy to win?",
-             "label": "Winning tips"}
-        ]
-    else:
-        follow_ups = [
-            {"question": "How do you play Hejla step by step?",
-             "label": "Basic rules"},
-            {"question": "What do you need to play Hejla?",
-             "label": "Equipment needed"},
-            {"question": "Can Hejla be played indoors?",
-             "label": "Playing locations"}
-        ]
+    follow_ups = [
+        {"question": question, "label": label}
+        for question, label in FOLLOW_UPS[match.follow_up_set]
+    ]
 
     # Create action buttons
     actions = [
@@ -246,17 +134,18 @@ async def send_follow_up_suggestions(topic):
         )
     )
 
-    # Send follow-up suggestions
-    suggestion_msg = cl.Message(
-        content="Want to chat about:",
-        actions=actions
-    )
-    await suggestion_msg.send()
+    return actions
 
 @cl.on_chat_start
 async def on_chat_start():
-    # Initialize user session
-    cl.user_session.set("user_level", "novice")
+    metrics.ACTIVE_SESSIONS.inc()
+
+    # Pick up where we left off if the session store knows this conversation
+    # (another worker, or this one before a restart, may have served it)
+    state = await session_state.restore()
+    if not state.waiting_for_name:
+        await cl.Message(content=f"Welcome back, {state.user_name}! 🙌 What else do you want to know about Hejla?").send()
+        return
 
     # First message
     intro_text = (
@@ -265,45 +154,30 @@ async def on_chat_start():
         "What's your name? I'd love to chat about this awesome Sudanese hopscotch game!"
     )
 
-    # Send introduction
-    await cl.Message(content=intro_text).send()
-
-    # Create image objects and store them in user session
-    try:
-        opener_image = cl.Image(path=OPENER_IMAGE_PATH, name="opener", display="inline")
-        cultural_image = cl.Image(path=CULTURAL_IMAGE_PATH, name="hejla_cultural", display="inline")
-        rules_image = cl.Image(path=RULES_IMAGE_PATH, name="hejla_rules", display="inline")
-        history_image = cl.Image(path=HISTORY_IMAGE_PATH, name="hejla_history", display="inline")
-
-        # Store media in user session
-        cl.user_session.set("opener_image", opener_image)
-        cl.user_session.set("cultural_image", cultural_image)
-        cl.user_session.set("rules_image", rules_image)
-        cl.user_session.set("history_image", history_image)
-    except Exception as e:
-        # Handle image loading errors gracefully
-        print(f"Error loading images: {e}")
-        await cl.Message(content="(Some visuals might not load, but we can still chat! 😊)").send()
+    # Images are prepared once per process in the background; just warn if that failed
+    # (not while it's still running: on a cold start they fall back to the originals)
+    intro = TurnComposer().add(intro_text)
+    if assets.failed():
+        intro.add("(Some visuals might not load, but we can still chat! 😊)")
 
-    # Set flag to wait for user's name
-    cl.user_session.set("waiting_for_name", True)
+    # Send introduction
+    await intro.send()
 
-    # Setup runnable
-    setup_runnable()
 
 @cl.on_message
 async def on_message(message: cl.Message):
     # Check if we're waiting for the user's name
-    waiting_for_name = cl.user_session.get("waiting_for_name", False)
+    state = get_state()
 
-    if waiting_for_name:
+    if state.waiting_for_name:
         # Store the user's name
         user_name = message.content.strip()
-        cl.user_session.set("user_name", user_name)
-        cl.user_session.set("waiting_for_name", False)
+        state.user_name = user_name
+        state.waiting_for_name = False
+        await session_state.save()
 
-        # Get the opener image from user session
-        opener_image = cl.user_session.get("opener_image")
+        # Get the shared opener image
+        opener_image = assets.image("opener", name="opener")
 
         # Welcome message
         welcome_text = (
@@ -311,13 +185,8 @@ async def on_message(message: cl.Message):
             "What would you like to know about Hejla? Pick something below or just ask me anything! 😊"
         )
 
-        # Send welcome message with image if available
-        if opener_image:
-            welcome_msg = cl.Message(content=welcome_text, elements=[opener_image])
-        else:
-            welcome_msg = cl.Message(content=welcome_text)
-
-        await welcome_msg.send()
+        # Welcome, opener image, starter questions and the drawing hint go out as one message
+        welcome = TurnComposer().add(welcome_text, elements=[opener_image])
 
         # Initial suggested questions
         actions = [
@@ -348,83 +217,287 @@ async def on_message(message: cl.Message):
             )
         ]
 
-        # Send message with actions
-        suggestion_msg = cl.Message(content="What interests you?", actions=actions)
-        await suggestion_msg.send()
-
         # Add a hint about visual explanations
-        await cl.Message(content="(Ask about rules or 'how to play' and I'll show you with drawings! 🎨)").send()
+        welcome.add("(Ask about rules or 'how to play' and I'll show you with drawings! 🎨)", actions=actions)
+        await welcome.send()
 
     else:
-        # Normal message handling
-        runnable = cl.user_session.get("runnable")
-        user_name = cl.user_session.get("user_name", "friend")
-        user_level = cl.user_session.get("user_level", "novice")
-
-        # Update context
-        context = {
-            "question": message.content,
-            "user_name": user_name,
-            "user_level": user_level
-        }
-
-        # Create a message for the response
-        res = cl.Message(content="")
-
-        # Stream the response
-        async for chunk in runnable.astream(
-                context,
-                config=RunnableConfig(callbacks=[cl.LangchainCallbackHandler()])
-        ):
-            await res.stream_token(chunk)
-
-        # Send the response
+        # Normal message handling: classify once and pass the result along
+        await answer_question(message.content, classify(message.content))
+
+# Streamed into the answer while a request waits for an LLM slot
+HANG_ON_TEXT = "Hang on a sec, lots of friends are hopping in right now... 🦶"
+BUSY_TEXT = "Whoa, so many questions at once! Give me a few seconds and ask again 😅"
+# Appended to an answer cut short by a newer question
+SUPERSEDED_TEXT = " …\n\n_(Stopped here to answer your new question!)_"
+
+async def answer_question(question, match, handler="on_message", lead=None, with_image=True):
+    """Run one turn as a small pipeline.
+
+    The LLM stream starts straight away. Meanwhile `lead` sends the message
+    that belongs above the answer (tokens are held until it is done), and the
+    topic image and follow-up suggestions are prepared so they go out on the
+    answer message itself when it is complete.
+    """
+    # A newer question replaces whatever this session was still streaming
+    streams.cancel(cl.context.session.id, "superseded")
+
+    extras = TurnComposer()
+    try:
+        async with asyncio.TaskGroup() as tg:
+            lead_task = tg.create_task(lead()) if lead else None
+            answered = tg.create_task(stream_answer(question, match, handler, gate=lead_task, extras=extras))
+            prepare_extras(extras, match, question, with_image)
+    except* Exception as group:
+        # Show the user the real error, not "unhandled errors in a TaskGroup"
+        raise group.exceptions[0]
+
+    if not answered.result():
+        return
+
+    # Warm the answers to those suggestions while the user reads
+    if settings.PREFETCH_ENABLED and settings.ANSWER_CACHE_ENABLED:
+        prefetcher.offer(cl.context.session.id, [q for q, _ in FOLLOW_UPS[match.follow_up_set]],
+                         get_state().user_level)
+
+    # Fold turns that left the memory window into the summary, in the background
+    memory.schedule_fold(cl.context.session.id, get_state(), on_done=session_state.save)
+
+    # Persist the turn so the conversation can resume on any worker
+    await session_state.save()
+
+def release_llm_slot():
+    """Give back an LLM slot once the upstream stream it was taken for has ended"""
+    metrics.INFLIGHT_STREAMS.dec()
+    governor.release()
+
+def prepare_extras(extras, match, question, with_image=True):
+    """Gather the topic image (if any) and the follow-up suggestions for the answer message"""
+    start = time.perf_counter()
+    if with_image and match.image_key:
+        extras.add(elements=[assets.image(match.image_key)])
+        extras.prepared["image"] = time.perf_counter() - start
+        start = time.perf_counter()
+    extras.add(actions=build_follow_up_actions(match, question))
+    extras.prepared["follow_up"] = time.perf_counter() - start
+    return extras
+
+async def stream_answer(question, match, handler, gate=None, extras=None):
+    """Stream Zola's answer into a new message; False if we were too busy to answer.
+
+    `extras` (a TurnComposer) is attached to the answer message when it completes.
+    """
+    state = get_state()
+    user_level = state.user_level
+
+    # Pick the prompt variant and output cap for this kind of question
+    intent = prompts.classify_intent(question)
+    runnable = get_runnable(prompts.model_intent(intent))
+    # Follow-ups get the recent turns and the summary of older ones; answers given
+    # with memory belong to this conversation, so they aren't cached or shared
+    history = memory.messages(state, question) if intent != prompts.OFF_TOPIC else []
+    context = prompts.build_context(question, user_level, history)
+    scope = memory.scope(prompts.scope(intent, user_level), history)
+    cacheable = settings.ANSWER_CACHE_ENABLED and not history
+
+    # Create a message for the response, streamed in coalesced batches;
+    # [[board ...]] and [[name]] slots written by the model are filled locally
+    res = cl.Message(content="")
+    stream = TokenCoalescer(res, gate=gate)
+    board = BoardExpander(state.user_name)
+
+    # Off-topic questions get the canned deflection without a model call;
+    # repeated questions replay a cached answer; everything else asks the model
+    timer = metrics.StreamTimer(handler, match.topic)
+    if intent == prompts.OFF_TOPIC and settings.LOCAL_DEFLECTION:
+        cached = [prompts.OFF_TOPIC_REPLY]
+        outcome = {"source": "local", "intent": intent}
+    else:
+        cached = answer_cache.get(question, scope) if cacheable else None
+        outcome = {"source": "cache", "intent": intent}
+    flight = None
+    report = {}
+
+    # Register so a disconnect, the stop button or a newer question can cancel us
+    session_id = cl.context.session.id
+    task = asyncio.current_task()
+    streams.register(session_id, task)
+    trace = tracer.start_turn(handler, match.topic, question, session_id)
+    error = None
+    try:
+        if cached is not None:
+            chunks = cached
+            if prefetcher.mark_used(question, scope):
+                outcome["source"] = "prefetch"
+            async for chunk in replay(cached):
+                timer.chunk()
+                await stream.push(board.feed(chunk))
+            timer.finish(source=outcome["source"])
+        else:
+            chunks = []
+            # Identical questions already streaming for someone else are shared, not re-asked
+            key = f"{scope}:{normalize(question)}"
+            flight = single_flight.join(key) if settings.SINGLE_FLIGHT_ENABLED else None
+            shared = flight is not None
+            try:
+                # Wait for a fair share of the LLM capacity, showing a placeholder if queued;
+                # followers of a shared stream don't need a slot of their own
+                release = None
+                if flight is None:
+                    await governor.acquire(session_id, on_queued=lambda: stream.placeholder(HANG_ON_TEXT))
+                    metrics.INFLIGHT_STREAMS.inc()
+                    release = release_llm_slot
+                    # Hedged runnables report which provider won and how fast
+                    extra = {"report": report} if isinstance(runnable, HedgedRunnable) else {}
+                    upstream = runnable.astream(
+                        context,
+                        config={"callbacks": [
+                            metrics.prompt_timer(handler, match.topic),
+                            *tracer.callbacks(trace),
+                        ]},
+                        **extra
+                    )
+                    if settings.SINGLE_FLIGHT_ENABLED:
+                        # The shared upstream keeps the slot until it ends, even if we leave first
+                        flight = single_flight.start(key, upstream, on_release=release)
+                        release = None
+                        # Someone else started the same question while we waited for the slot
+                        shared = flight.followers > 0
+                        upstream = flight.follow()
+                else:
+                    # Late joiners get the buffered prefix first, then live chunks
+                    upstream = flight.follow()
+                try:
+                    async for chunk in upstream:
+                        timer.chunk()
+                        chunks.append(chunk)
+                        await stream.push(board.feed(chunk))
+                except Exception:
+                    metrics.TURN_ERRORS.labels(handler, match.topic).inc()
+                    raise
+                finally:
+                    if release is not None:
+                        release()
+                    if "provider" in report:
+                        metrics.PROVIDER_WINS.labels(report["provider"], report["reason"]).inc()
+                        metrics.PROVIDER_FIRST_CHUNK.labels(report["provider"]).observe(report["first_chunk"])
+            except Busy:
+                outcome["source"] = "busy"
+                await stream.placeholder(BUSY_TEXT)
+                await res.send()
+                return False
+            outcome["source"] = "shared" if shared else "llm"
+            timer.finish(source=outcome["source"])
+            if not shared:
+                streams.completed(timer.chunks)
+
+            # Only complete answers are cached (once, by whoever started the stream)
+            if cacheable and not shared:
+                answer_cache.put(question, chunks, scope)
+
+        await stream.push(board.close())
+        await stream.close()
+
+        # Send the response, with its image and suggestions, and remember the turn
+        # (raw text, board slots unexpanded)
+        if extras:
+            extras.attach(res)
+        sent = time.perf_counter()
         await res.send()
-
-        # Check if we should show an image based on the topic
-        topic = message.content.lower()
-        description, image_path = get_topic_description(topic)
-
-        # Get appropriate image from user session based on topic
-        topic_image = None
-        if image_path == CULTURAL_IMAGE_PATH:
-            topic_image = cl.user_session.get("cultural_image")
-        elif image_path == RULES_IMAGE_PATH:
-            topic_image = cl.user_session.get("rules_image")
-        elif image_path == HISTORY_IMAGE_PATH:
-            topic_image = cl.user_session.get("history_image")
-
-        # If we have a relevant image, send it
-        if topic_image:
-            image_message = cl.Message(
-                content=f"Here, check this out:",
-                elements=[topic_image]
-            )
-            await image_message.send()
-
-        # Send follow-up suggestions
-        await send_follow_up_suggestions(topic)
+        if extras:
+            # The image and suggestions ride on the answer: preparing them plus the shared send
+            send_time = time.perf_counter() - sent
+            for part, histogram in (("image", metrics.IMAGE_SEND), ("follow_up", metrics.FOLLOW_UP)):
+                if part in extras.prepared:
+                    histogram.labels(handler, match.topic).observe(extras.prepared[part] + send_time)
+        state.add_turn(question, "".join(chunks))
+        return True
+    except asyncio.CancelledError:
+        reason = streams.reason(task)
+        if reason != "superseded":
+            # Stopped or disconnected: nothing more may reach the message
+            stream.discard()
+        if reason is None:
+            raise
+        swallow_cancel()
+        outcome["cancelled"] = reason
+        # Only the upstream we stopped counts as saved (a shared stream may go on for others)
+        upstream_stopped = cached is None and (flight is None or flight.cancelled)
+        streams.record_cancel(reason, handler, match.topic, timer.chunks, upstream_stopped)
+        if reason == "superseded":
+            # Keep what was said so far, marked as cut short
+            await stream.push(board.close())
+            await stream.push(SUPERSEDED_TEXT)
+            await stream.close()
+            await res.send()
+        return False
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        streams.unregister(session_id, task)
+        # Kept only if sampled, failed or slow; written out in the background
+        if timer.first is not None:
+            outcome["first_chunk"] = round(timer.first - timer.start, 4)
+        tracer.finish(trace, error=error, chunks=timer.chunks, provider=report.get("provider"), **outcome)
+
+@cl.on_stop
+async def on_stop():
+    # Chainlit cancels the running turn; make sure its upstream stream stops too
+    streams.cancel(cl.context.session.id, "stop")
+
+@cl.on_chat_end
+async def on_chat_end():
+    metrics.ACTIVE_SESSIONS.dec()
+    # Nobody is left to read the answer: stop generating it
+    streams.cancel(cl.context.session.id, "disconnect")
+    governor.forget(cl.context.session.id)
+    prefetcher.forget(cl.context.session.id)
+
+@cl.on_app_startup
+async def on_app_startup():
+    # Watch the event loop for handlers that block everyone else's streams
+    if settings.LOOP_WATCH:
+        loopwatch.watch.start()
+
+    # Build the shared chain and images (in the background unless configured otherwise)
+    await startup.on_startup()
+
+@cl.on_app_shutdown
+async def on_app_shutdown():
+    # Release the shared Cohere connection pool and the session store, flush traces and queued writes
+    await prefetcher.close()
+    await memory.close()
+    await close_shared_client()
+    await close_store()
+    await tracer.close()
+    await persistence.close()
+    loopwatch.watch.stop()
 
 # Quiz functionality
 @cl.action_callback("quiz_request")
 async def on_quiz_request(action):
     """Handle request for a quiz question"""
+    topic = classify(action.payload.get("topic", "")).topic
+    with metrics.timed(metrics.QUIZ_ACTION, "quiz_request", topic):
+        await _handle_quiz_request(action)
+
+async def _handle_quiz_request(action):
     topic = action.payload.get("topic", "")
     user_level = action.payload.get("level", "novice")
 
-    # Store the topic for later use
-    cl.user_session.set("quiz_topic", topic)
-
-    # Select 3 relevant quiz questions
-    questions = await select_relevant_quiz_questions(topic, count=3, user_level=user_level)
+    # Select relevant quiz question IDs
+    questions = await select_relevant_quiz_questions(classify(topic), count=settings.QUIZ_LENGTH,
+                                                     user_level=user_level)
     if questions:
-        # Store the quiz questions and initialize quiz state
-        cl.user_session.set("quiz_questions", questions)
-        cl.user_session.set("current_quiz_question", 0)
-        cl.user_session.set("quiz_score", 0)
-        cl.user_session.set("quiz_total", len(questions))
+        # Store the quiz question IDs, topic and a fresh score
+        get_state().start_quiz(questions, topic)
+        await session_state.save()
 
         # Start the quiz
+        if settings.QUIZ_MODE == "element":
+            await send_quiz_element(questions)
+            return
         await cl.Message(content="Let's test your Hejla knowledge! 🦶").send()
         await send_quiz_question(questions[0])
     else:
@@ -433,15 +506,21 @@ async def on_quiz_request(action):
 @cl.action_callback("quiz_answer")
 async def on_quiz_answer(action):
     """Handle quiz answer selection"""
-    question = action.payload.get("question", "")
+    topic = classify(get_state().quiz_topic).topic
+    with metrics.timed(metrics.QUIZ_ACTION, "quiz_answer", topic):
+        await _handle_quiz_answer(action)
+
+async def _handle_quiz_answer(action):
+    question = await run_blocking(quiz_store.get, action.payload.get("id"))
     selected_index = action.payload.get("selected_index", -1)
-    correct_index = action.payload.get("correct_index", -1)
-    topic = cl.user_session.get("quiz_topic", "")
+    correct_index = question["correct"] if question else -1
+    state = get_state()
+    topic = state.quiz_topic
 
     # Retrieve quiz state
-    quiz_questions = cl.user_session.get("quiz_questions", [])
-    current_question_index = cl.user_session.get("current_quiz_question", 0)
-    quiz_score = cl.user_session.get("quiz_score", 0)
+    quiz_questions = state.quiz_ids
+    current_question_index = state.quiz_index
+    quiz_score = state.quiz_score
 
     # Check if answer is correct
     is_correct = selected_index == correct_index
@@ -449,86 +528,123 @@ async def on_quiz_answer(action):
     # Update score if correct
     if is_correct:
         quiz_score += 1
-        cl.user_session.set("quiz_score", quiz_score)
-        await cl.Message(content=f"Yes! Nailed it! 🎯").send()
+        state.quiz_score = quiz_score
+        await cl.Message(content="Yes! Nailed it! 🎯").send()
     else:
         # Get correct option text
-        correct_option = "Unknown"
-        for q in quiz_questions:
-            if q["question"] == question:
-                correct_option = q["options"][correct_index]
-                break
+        correct_option = question["options"][correct_index] if question else "Unknown"
         await cl.Message(content=f"Ah, close! It's actually **{correct_option}** 😅").send()
 
+    # Persisted in the background, like the rest of the conversation
+    persistence.record("quiz_answer", question_id=action.payload.get("id"), topic=topic, correct=is_correct)
+
     # Move to next question or finish quiz
     current_question_index += 1
-    cl.user_session.set("current_quiz_question", current_question_index)
+    state.quiz_index = current_question_index
+    await session_state.save()
 
     # Check if we have more questions
-    if current_question_index < len(quiz_questions) and current_question_index < 3:
+    total = min(len(quiz_questions), settings.QUIZ_LENGTH)
+    if current_question_index < total:
         # Send next question
         await send_quiz_question(quiz_questions[current_question_index])
     else:
         # Quiz complete - show score
-        score_percentage = quiz_score / min(len(quiz_questions), 3) * 100
-
-        # Provide feedback
-        if score_percentage >= 80:
-            feedback = "You're pretty good at this! 🌟"
-        elif score_percentage >= 50:
-            feedback = "Not bad at all! Getting the hang of it 👍"
-        else:
-            feedback = "Hey, we all start somewhere! 😊"
+        persistence.record("quiz_result", topic=topic, score=quiz_score, total=total)
 
         # Send quiz completion message
-        await cl.Message(
-            content=f"Quiz done! You got {quiz_score}/{min(len(quiz_questions), 3)} 🏆\n\n{feedback}").send()
+        await cl.Message(content=quiz_result_text(quiz_score, total)).send()
 
         # After quiz is complete, show relevant follow-up suggestions
-        await send_follow_up_suggestions(topic)
+        await send_follow_up_suggestions(classify(topic), topic, "quiz_answer")
+
+def quiz_result_text(score, total):
+    """Final score line with a bit of encouragement"""
+    score_percentage = score / total * 100 if total else 0
+
+    # Provide feedback
+    if score_percentage >= 80:
+        feedback = "You're pretty good at this! 🌟"
+    elif score_percentage >= 50:
+        feedback = "Not bad at all! Getting the hang of it 👍"
+    else:
+        feedback = "Hey, we all start somewhere! 😊"
+    return f"Quiz done! You got {score}/{total} 🏆\n\n{feedback}"
+
+@cl.action_callback("quiz_submit")
+async def on_quiz_submit(action):
+    """Score a whole quiz posted back by the Quiz element"""
+    topic = classify(get_state().quiz_topic).topic
+    with metrics.timed(metrics.QUIZ_ACTION, "quiz_submit", topic):
+        await _handle_quiz_submit(action)
+
+async def _handle_quiz_submit(action):
+    state = get_state()
+    topic = state.quiz_topic
+    answers = action.payload.get("answers") or {}
+
+    # Only the quiz we handed out counts, and only once
+    if not state.quiz_ids or state.quiz_index >= state.quiz_total:
+        return
+
+    # The browser already showed right and wrong; the score is recomputed from the bank
+    # rather than trusted, which is a few dict lookups
+    def score_answers():
+        score = 0
+        for question_id in state.quiz_ids:
+            question = quiz_store.get(question_id)
+            if question and answers.get(question_id) == question["correct"]:
+                score += 1
+        return score
+
+    quiz_score = await run_blocking(score_answers)
+    state.quiz_score = quiz_score
+    state.quiz_index = state.quiz_total
+    await session_state.save()
+    persistence.record("quiz_result", topic=topic, score=quiz_score, total=state.quiz_total)
+
+    # Score and what to chat about next go out as one message
+    match = classify(topic)
+    result = TurnComposer().add(quiz_result_text(quiz_score, state.quiz_total))
+    result.add("Want to chat about:", actions=build_follow_up_actions(match, topic))
+    with metrics.timed(metrics.FOLLOW_UP, "quiz_submit", match.topic):
+        await result.send()
 
 # Dynamic suggestion callback
 @cl.action_callback("dynamic_suggestion")
 async def on_dynamic_suggestion_action(action):
     """Handle clicks on dynamic suggestions"""
     question = action.payload.get("question", "")
-
-    if question:
-        # Get appropriate image based on the question content
-        topic_image = None
-        question_lower = question.lower()
-
-        if "rules" in question_lower or "play" in question_lower or "how" in question_lower or "hop" in question_lower:
-            topic_image = cl.user_session.get("rules_image")
-        elif "squares" in question_lower or "draw" in question_lower or "chalk" in question_lower:
-            topic_image = cl.user_session.get("rules_image")
-        elif "girls" in question_lower or "cultural" in question_lower or "traditional" in question_lower:
-            topic_image = cl.user_session.get("cultural_image")
-        elif "home" in question_lower or "win" in question_lower or "strategy" in question_lower:
-            topic_image = cl.user_session.get("rules_image")
-
-        # Send the appropriate image first if available
-        if topic_image:
-            image_topic = ""
-            if topic_image == cl.user_session.get("rules_image"):
-                image_topic = "the squares and rules"
-            elif topic_image == cl.user_session.get("cultural_image"):
-                image_topic = "how girls play it"
-            elif topic_image == cl.user_session.get("history_image"):
-                image_topic = "where Hejla comes from"
-
-            image_message = cl.Message(
-                content=f"Here's a pic showing {image_topic}:",
-                elements=[topic_image]
-            )
-            await image_message.send()
-
-        # Add ASCII art hint for rules questions
-        if "rules" in question_lower or "how" in question_lower or "play" in question_lower:
-            await cl.Message(content="Let me draw this out for you! 📐").send()
-
-        # Process the message
-        await on_message(cl.Message(content=question))
+    persistence.record("suggestion_click", question=question)
+
+    # Ignore repeated clicks while the answer to this suggestion is still streaming
+    session_id = cl.context.session.id
+    if question and governor.begin_question(session_id, normalize(question)):
+        try:
+            await _answer_suggestion(question)
+        finally:
+            governor.end_question(session_id, normalize(question))
+
+async def _answer_suggestion(question):
+    """Answer a suggestion, with its picture and drawing hint shown above the answer"""
+    # Classify once; the image, drawing hint and answer all share the result
+    match = classify(question)
+
+    # The picture and the drawing hint share one message above the answer
+    lead_message = TurnComposer()
+    if match.image_key:
+        lead_message.add(f"Here's a pic showing {IMAGE_CAPTIONS[match.image_key]}:",
+                         elements=[assets.image(match.image_key)])
+    if match.wants_drawing:
+        lead_message.add("Let me draw this out for you! 📐")
+
+    async def lead():
+        with metrics.timed(metrics.IMAGE_SEND, "dynamic_suggestion", match.topic):
+            await lead_message.send()
+
+    # The LLM call starts while the lead message is going out; the picture isn't repeated below
+    await answer_question(question, match, "dynamic_suggestion",
+                          lead=lead if lead_message else None, with_image=not match.image_key)
 
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 8000))  # Use Render's PORT env variable
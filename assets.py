@@ -0,0 +1,138 @@
+# Process-wide image registry: each picture is read and optimized once at startup
+import hashlib
+import os
+import threading
+import chainlit as cl
+from loopwatch import log
+
+# Source images, keyed by the name used throughout the app
+ASSET_SOURCES = {
+    "opener": "culture.png",  # Opener image
+    "cultural": "trad.jpeg",  # Girls playing Hejla
+    "rules": "rules.png",  # Illustrated Hejla squares and rules
+    "history": "history.gif",  # Historical context of Hejla
+}
+
+# Web-optimized variants: name -> (max width/height, WebP quality)
+VARIANTS = {
+    "web": (1024, 80),
+}
+
+# Generated files live under Chainlit's static /public route
+OUTPUT_DIR = os.path.join("public", "assets")
+PUBLIC_URL = "/public/assets"
+
+# Browsers may keep hashed files forever: a new picture gets a new name
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# key -> {variant: url}
+_urls = {}
+# key -> error message for images that could not be prepared
+_errors = {}
+_lock = threading.Lock()
+_background_load = None
+
+
+def _content_hash(data, variant):
+    """Short hash of the source bytes plus the variant spec"""
+    size, quality = VARIANTS[variant]
+    digest = hashlib.sha256(data)
+    digest.update(f"{variant}:{size}:{quality}".encode())
+    return digest.hexdigest()[:12]
+
+
+def _write_variant(source, target, variant):
+    """Downscale and re-encode one image as WebP (animated GIFs stay animated)"""
+    # Pillow is only needed when a variant isn't on disk yet
+    from PIL import Image, ImageSequence
+
+    size, quality = VARIANTS[variant]
+    with Image.open(source) as img:
+        if getattr(img, "is_animated", False):
+            frames = []
+            for frame in ImageSequence.Iterator(img):
+                frame = frame.convert("RGBA")
+                frame.thumbnail((size, size))
+                frames.append(frame)
+            frames[0].save(
+                target, "WEBP", save_all=True, append_images=frames[1:],
+                quality=quality, loop=img.info.get("loop", 0),
+                duration=img.info.get("duration", 100),
+            )
+        else:
+            img = img.convert("RGBA" if img.mode in ("RGBA", "LA", "P") else "RGB")
+            img.thumbnail((size, size))
+            img.save(target, "WEBP", quality=quality, method=6)
+
+
+def load_assets():
+    """Read every source image once and build its variants (skips existing files)"""
+    with _lock:
+        _load_assets()
+
+
+def _load_assets():
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    for key, source in ASSET_SOURCES.items():
+        try:
+            with open(source, "rb") as f:
+                data = f.read()
+            urls = {}
+            for variant in VARIANTS:
+                filename = f"{key}-{variant}.{_content_hash(data, variant)}.webp"
+                target = os.path.join(OUTPUT_DIR, filename)
+                if not os.path.exists(target):
+                    _write_variant(source, target, variant)
+                urls[variant] = f"{PUBLIC_URL}/{filename}"
+            _urls[key] = urls
+            _errors.pop(key, None)
+        except Exception as e:
+            log(f"Error preparing image {source}: {e}")
+            _errors[key] = str(e)
+
+
+def _load_in_background():
+    """Build the variants on a thread (once) when the warm-up hook hasn't done it"""
+    global _background_load
+    if _background_load is None or not _background_load.is_alive():
+        _background_load = threading.Thread(target=load_assets, name="load-assets", daemon=True)
+        _background_load.start()
+
+
+def failed():
+    """True if any image could not be prepared (still warming up doesn't count)"""
+    return bool(_errors)
+
+
+def image(key, variant="web", name=None, display="inline"):
+    """Build a lightweight cl.Image pointing at the cached variant.
+
+    Elements are cheap URL references, so a fresh one is made per message
+    instead of sharing one mutable element between sessions. If the
+    variant isn't ready (still warming up) or could not be built, fall back
+    to the original file rather than doing Pillow work on the event loop.
+    """
+    if not _urls and not _errors and not _lock.locked():
+        _load_in_background()
+    if key not in ASSET_SOURCES:
+        return None
+    name = name or f"hejla_{key}"
+    url = _urls.get(key, {}).get(variant)
+    if url:
+        return cl.Image(url=url, name=name, display=display)
+    return cl.Image(path=ASSET_SOURCES[key], name=name, display=display)
+
+
+def install_cache_headers(app):
+    """Add long-lived cache headers to the hashed asset files"""
+    # Already there if this module was re-imported by a reload
+    if any(getattr(m.kwargs.get("dispatch"), "__name__", None) == "asset_cache_headers"
+           for m in app.user_middleware):
+        return
+
+    @app.middleware("http")
+    async def asset_cache_headers(request, call_next):
+        response = await call_next(request)
+        if request.url.path.startswith(PUBLIC_URL + "/") and response.status_code == 200:
+            response.headers["Cache-Control"] = CACHE_CONTROL
+        return response
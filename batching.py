@@ -0,0 +1,29 @@
+# Background batching loop shared by the trace exporter and the write-behind queue
+import asyncio
+import time
+
+
+async def run_batches(queue, batch_size, flush_interval, flush, flush_now):
+    """Take items off `queue` in batches and hand each one to `flush`.
+
+    A batch closes at `batch_size` items or `flush_interval` seconds after its
+    first item, whichever comes first. `flush` is awaited; `flush_now` is the
+    synchronous version, used when the loop is cancelled mid-batch so the items
+    already taken off the queue aren't lost.
+    """
+    while True:
+        batch = [await queue.get()]
+        deadline = time.monotonic() + flush_interval
+        try:
+            while len(batch) < batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+        except asyncio.CancelledError:
+            flush_now(batch)
+            raise
+        await flush(batch)
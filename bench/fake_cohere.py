@@ -0,0 +1,263 @@
+"""Local stand-in for the Cohere (and OpenAI) streaming chat APIs.
+
+Serves /v1/chat (Cohere, newline-delimited JSON), /v2/chat (Cohere,
+server-sent events) and /v1/chat/completions (OpenAI, server-sent events)
+with a configurable first-token latency, token rate, chunk size and error
+rate, or replays recorded token streams from a JSONL file (one JSON list of
+chunks per line).
+
+    python bench/fake_cohere.py --port 8911 --latency 0.4 --token-rate 60
+    COHERE_BASE_URL=http://127.0.0.1:8911 COHERE_API_KEY=fake chainlit run app.py
+
+Two instances make a hedging test bed (slow, flaky primary; fast secondary):
+
+    python bench/fake_cohere.py --port 8911 --latency 3 --fail-rate 0.3
+    python bench/fake_cohere.py --port 8912 --latency 0.2
+    COHERE_BASE_URL=http://127.0.0.1:8911 HEDGE_PROVIDER=openai \
+        OPENAI_BASE_URL=http://127.0.0.1:8912/v1 OPENAI_API_KEY=fake chainlit run app.py
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+import uuid
+from aiohttp import web
+
+WORDS = (
+    "Hejla is super fun you draw eight squares with chalk and hop on one foot "
+    "throw the stone into square one then hop backwards skipping it kick the "
+    "stone out and never step on the lines or you lose your turn"
+).split()
+
+
+class FakeStream:
+    """Produces the chunks for one fake answer"""
+
+    def __init__(self, latency=0.3, token_rate=50.0, chunk_size=1, tokens=200,
+                 jitter=0.0, replay=None, fail_rate=0.0):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.token_rate = token_rate
+        self.chunk_size = chunk_size
+        self.tokens = tokens
+        self.jitter = jitter
+        self._replay = itertools.cycle(replay) if replay else None
+        # Counters the load test reads back via GET /stats
+        self.requests = 0
+        self.active = 0
+        self.cancelled = 0
+        self.failed = 0
+
+    def should_fail(self):
+        if random.random() < self.fail_rate:
+            self.failed += 1
+            return True
+        return False
+
+    def _chunks(self):
+        if self._replay is not None:
+            return list(next(self._replay))
+        words = [random.choice(WORDS) for _ in range(self.tokens)]
+        return [" ".join(words[i:i + self.chunk_size]) + " "
+                for i in range(0, len(words), self.chunk_size)]
+
+    async def chunks(self):
+        """Yield chunks at the configured pace"""
+        await asyncio.sleep(self.latency * (1 + random.uniform(-self.jitter, self.jitter)))
+        for chunk in self._chunks():
+            yield chunk
+            tokens = max(1, len(chunk.split()))
+            await asyncio.sleep(tokens / self.token_rate)
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode()
+
+
+def _error():
+    return web.json_response({"message": "injected failure"}, status=500)
+
+
+def make_app(stream):
+    """Build the aiohttp app serving fake Cohere and OpenAI endpoints"""
+
+    async def chat_v1(request):
+        body = await request.json()
+        stream.requests += 1
+        if stream.should_fail():
+            return _error()
+        generation_id = str(uuid.uuid4())
+        if not body.get("stream"):
+            text = "".join([c async for c in stream.chunks()])
+            return web.json_response({"text": text, "generation_id": generation_id,
+                                      "finish_reason": "COMPLETE"})
+
+        response = web.StreamResponse(headers={"Content-Type": "application/stream+json"})
+        await response.prepare(request)
+        stream.active += 1
+        text = []
+        try:
+            await response.write((json.dumps({"is_finished": False, "event_type": "stream-start",
+                                              "generation_id": generation_id}) + "\n").encode())
+            async for chunk in stream.chunks():
+                text.append(chunk)
+                await response.write((json.dumps({"is_finished": False, "event_type": "text-generation",
+                                                  "text": chunk}) + "\n").encode())
+            await response.write((json.dumps({
+                "is_finished": True, "event_type": "stream-end", "finish_reason": "COMPLETE",
+                "response": {"text": "".join(text), "generation_id": generation_id,
+                             "finish_reason": "COMPLETE"},
+            }) + "\n").encode())
+        except (ConnectionResetError, asyncio.CancelledError):
+            stream.cancelled += 1
+            raise
+        finally:
+            stream.active -= 1
+        return response
+
+    async def chat_v2(request):
+        body = await request.json()
+        stream.requests += 1
+        if stream.should_fail():
+            return _error()
+        message_id = str(uuid.uuid4())
+        if not body.get("stream"):
+            text = "".join([c async for c in stream.chunks()])
+            return web.json_response({
+                "id": message_id, "finish_reason": "COMPLETE",
+                "message": {"role": "assistant", "content": [{"type": "text", "text": text}]},
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        stream.active += 1
+        output_tokens = 0
+        try:
+            await response.write(_sse("message-start", {
+                "type": "message-start", "id": message_id,
+                "delta": {"message": {"role": "assistant", "content": []}},
+            }))
+            await response.write(_sse("content-start", {
+                "type": "content-start", "index": 0,
+                "delta": {"message": {"content": {"type": "text", "text": ""}}},
+            }))
+            async for chunk in stream.chunks():
+                output_tokens += max(1, len(chunk.split()))
+                await response.write(_sse("content-delta", {
+                    "type": "content-delta", "index": 0,
+                    "delta": {"message": {"content": {"text": chunk}}},
+                }))
+            await response.write(_sse("content-end", {"type": "content-end", "index": 0}))
+            usage = {"input_tokens": 900, "output_tokens": output_tokens}
+            await response.write(_sse("message-end", {
+                "type": "message-end",
+                "delta": {"finish_reason": "COMPLETE",
+                          "usage": {"billed_units": usage, "tokens": usage}},
+            }))
+        except (ConnectionResetError, asyncio.CancelledError):
+            stream.cancelled += 1
+            raise
+        finally:
+            stream.active -= 1
+        return response
+
+    async def chat_openai(request):
+        body = await request.json()
+        stream.requests += 1
+        if stream.should_fail():
+            return _error()
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        model = body.get("model", "fake")
+        if not body.get("stream"):
+            text = "".join([c async for c in stream.chunks()])
+            return web.json_response({
+                "id": completion_id, "object": "chat.completion", "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": text}}],
+            })
+
+        def event(delta, finish_reason=None):
+            data = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            return f"data: {json.dumps(data)}\n\n".encode()
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        stream.active += 1
+        try:
+            await response.write(event({"role": "assistant", "content": ""}))
+            async for chunk in stream.chunks():
+                await response.write(event({"content": chunk}))
+            await response.write(event({}, "stop"))
+            await response.write(b"data: [DONE]\n\n")
+        except (ConnectionResetError, asyncio.CancelledError):
+            stream.cancelled += 1
+            raise
+        finally:
+            stream.active -= 1
+        return response
+
+    async def models(request):
+        # ChatCohere asks for the default chat model when none is configured
+        return web.json_response({"models": [{"name": "fake-command", "endpoints": ["chat"]}]})
+
+    async def stats(request):
+        return web.json_response({"requests": stream.requests, "active": stream.active,
+                                  "cancelled": stream.cancelled, "failed": stream.failed})
+
+    app = web.Application()
+    app.router.add_post("/v1/chat", chat_v1)
+    app.router.add_post("/v2/chat", chat_v2)
+    app.router.add_post("/v1/chat/completions", chat_openai)
+    app.router.add_get("/v1/models", models)
+    app.router.add_get("/stats", stats)
+    return app
+
+
+async def start(stream, host="127.0.0.1", port=8911):
+    """Start the fake server in the running loop; returns the runner to clean up"""
+    runner = web.AppRunner(make_app(stream))
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def load_replay(path):
+    """Read recorded streams: one JSON list of chunks per line"""
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def add_arguments(parser):
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds before the first token")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="tokens per second")
+    parser.add_argument("--chunk-size", type=int, default=1, help="tokens per streamed chunk")
+    parser.add_argument("--tokens", type=int, default=200, help="tokens per answer")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- fraction applied to latency")
+    parser.add_argument("--replay", help="JSONL file of recorded token streams")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of requests answered with HTTP 500")
+
+
+def stream_from_args(args):
+    return FakeStream(
+        latency=args.latency, token_rate=args.token_rate, chunk_size=args.chunk_size,
+        tokens=args.tokens, jitter=args.jitter, fail_rate=args.fail_rate,
+        replay=load_replay(args.replay) if args.replay else None,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8911)
+    add_arguments(parser)
+    args = parser.parse_args()
+    web.run_app(make_app(stream_from_args(args)), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
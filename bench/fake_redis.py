@@ -0,0 +1,105 @@
+"""Tiny in-memory stand-in for a Redis server, for trying the redis session store.
+
+Understands just what session_store.RedisStore uses: PING, AUTH, SELECT,
+GET, SET (with EX), DEL and EXPIRE, over the normal RESP protocol.
+
+    python bench/fake_redis.py --port 6390
+    SESSION_STORE=redis REDIS_URL=redis://127.0.0.1:6390/0 chainlit run app.py
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from session_store import read_reply  # noqa: E402
+
+
+def _bulk(value):
+    if value is None:
+        return b"$-1\r\n"
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+class FakeRedis:
+    """Key/value data with expiries, shared by all connections"""
+
+    def __init__(self, delay=0.0):
+        self.data = {}
+        self.commands = 0
+        # Seconds to wait before each reply, to mimic a slow or distant server
+        self.delay = delay
+
+    def _get(self, key):
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires is not None and expires < time.time():
+            del self.data[key]
+            return None
+        return value
+
+    def run(self, args):
+        self.commands += 1
+        name = args[0].decode().upper()
+        if name == "PING":
+            return b"+PONG\r\n"
+        if name in ("AUTH", "SELECT"):
+            return b"+OK\r\n"
+        if name == "GET":
+            return _bulk(self._get(args[1]))
+        if name == "SET":
+            expires = None
+            if len(args) >= 5 and args[3].decode().upper() == "EX":
+                expires = time.time() + int(args[4])
+            self.data[args[1]] = (args[2], expires)
+            return b"+OK\r\n"
+        if name == "DEL":
+            removed = sum(1 for key in args[1:] if self.data.pop(key, None) is not None)
+            return b":%d\r\n" % removed
+        if name == "EXPIRE":
+            value = self._get(args[1])
+            if value is None:
+                return b":0\r\n"
+            self.data[args[1]] = (value, time.time() + int(args[2]))
+            return b":1\r\n"
+        return f"-ERR unknown command '{name}'\r\n".encode()
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                args = await read_reply(reader)
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+                writer.write(self.run(args))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def start(server, host="127.0.0.1", port=6390):
+    """Start listening in the running loop; returns the asyncio server"""
+    return await asyncio.start_server(server.handle, host, port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds before each reply")
+    args = parser.parse_args()
+
+    async def serve():
+        server = await start(FakeRedis(args.delay), args.host, args.port)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
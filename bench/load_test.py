@@ -0,0 +1,376 @@
+"""Load test: N simulated socket.io users against the Chainlit app and a fake Cohere.
+
+Starts bench/fake_cohere.py in-process, launches `chainlit run app.py`
+pointed at it (unless --url is given), then drives every simulated user
+through the chat start, the name prompt, free-form messages, suggestion
+clicks and a quiz. Reports time-to-first-token, full latency percentiles,
+websocket emits per answer and server RSS per session.
+
+    python bench/load_test.py --sessions 50 --turns 2 --token-rate 80
+    python bench/load_test.py --url http://127.0.0.1:8000 --pid 1234 --no-fake
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import aiohttp
+import psutil
+import socketio
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fake_cohere  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+QUESTIONS = [
+    "How do you play Hejla?",
+    "What happens if you step on a line?",
+    "Why do girls play Hejla in the schoolyard?",
+    "How do you make a home square?",
+]
+SUGGESTIONS = [
+    "How do you draw the squares for Hejla?",
+    "Can boys play Hejla too?",
+]
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile (None for no samples)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+class Stats:
+    """Samples collected by every simulated user, grouped by flow"""
+
+    def __init__(self):
+        self.ttft = defaultdict(list)
+        self.total = defaultdict(list)
+        self.emits = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def add(self, flow, total, ttft=None, emits=None):
+        self.total[flow].append(total)
+        if ttft is not None:
+            self.ttft[flow].append(ttft)
+        if emits is not None:
+            self.emits[flow].append(emits)
+
+    def report(self):
+        rows = []
+        for flow in self.total:
+            row = {"flow": flow, "n": len(self.total[flow]), "errors": self.errors[flow]}
+            for name, values in (("ttft", self.ttft[flow]), ("total", self.total[flow])):
+                for pct in (50, 95, 99):
+                    value = percentile(values, pct)
+                    row[f"{name}_p{pct}"] = None if value is None else round(value * 1000, 1)
+            emits = self.emits[flow]
+            row["emits_per_answer"] = round(sum(emits) / len(emits), 1) if emits else None
+            rows.append(row)
+        return rows
+
+
+class SimUser:
+    """One browser tab: a socket.io connection plus REST action calls"""
+
+    def __init__(self, base_url, stats, timeout):
+        self.base_url = base_url
+        self.stats = stats
+        self.timeout = timeout
+        self.session_id = str(uuid.uuid4())
+        self.sio = socketio.AsyncClient(reconnection=False)
+        self.http = None
+        self._done = asyncio.Event()
+        self._started = False
+        self._turn_start = 0.0
+        self._first_token = None
+        self._emits = 0
+        self.actions = []
+        self.elements = []
+        self.last_message_id = None
+
+        self.sio.on("stream_token", self._on_token)
+        self.sio.on("new_message", self._on_message)
+        self.sio.on("action", self._on_action)
+        self.sio.on("element", self._on_element)
+        self.sio.on("task_start", self._on_task_start)
+        self.sio.on("task_end", self._on_task_end)
+
+    async def _on_token(self, data):
+        if self._first_token is None:
+            self._first_token = time.perf_counter()
+        self._emits += 1
+
+    async def _on_message(self, step):
+        self.last_message_id = step.get("id")
+        for action in step.get("actions") or []:
+            self.actions.append(action)
+
+    async def _on_action(self, action):
+        self.actions.append(action)
+
+    async def _on_element(self, element):
+        self.elements.append(element)
+
+    async def _wait_for(self, found, timeout=5.0):
+        """Poll until found() is truthy; the HTTP reply to an action can beat its websocket events"""
+        deadline = time.monotonic() + timeout
+        while not found() and time.monotonic() < deadline:
+            await asyncio.sleep(0.02)
+        return found()
+
+    async def _on_task_start(self, *args):
+        self._started = True
+
+    async def _on_task_end(self, *args):
+        # A task_end without a task_start in this turn is left over from the previous one
+        # (connection_successful sends a bare one, on_message sends two)
+        if self._started:
+            self._done.set()
+
+    def _begin(self):
+        self._done.clear()
+        self._started = False
+        self._first_token = None
+        self._emits = 0
+        self._turn_start = time.perf_counter()
+
+    def _finish(self, flow, streamed=True):
+        end = time.perf_counter()
+        ttft = self._first_token - self._turn_start if self._first_token else None
+        self.stats.add(flow, end - self._turn_start, ttft, self._emits if streamed else None)
+
+    async def connect(self):
+        self.http = aiohttp.ClientSession()
+        self._begin()
+        await self.sio.connect(
+            self.base_url,
+            socketio_path="/ws/socket.io",
+            transports=["websocket"],
+            auth={"clientType": "webapp", "sessionId": self.session_id, "threadId": None,
+                  "userEnv": "{}", "chatProfile": None},
+        )
+        await self.sio.emit("connection_successful")
+        # on_chat_start's first step arrives before it has sent anything; wait for the task
+        await asyncio.wait_for(self._done.wait(), self.timeout)
+        self._finish("chat_start", streamed=False)
+
+    async def say(self, text, flow):
+        """Send a user message and wait until the server finishes the task"""
+        self._begin()
+        await self.sio.emit("client_message", {
+            "message": {
+                "id": str(uuid.uuid4()), "threadId": None, "name": "User",
+                "type": "user_message", "output": text,
+                "createdAt": datetime.now(timezone.utc).isoformat(),
+            },
+            "fileReferences": None,
+        })
+        await asyncio.wait_for(self._done.wait(), self.timeout)
+        self._finish(flow)
+
+    async def click(self, name, payload, flow, label="", for_id=None):
+        """Call an action callback the way the UI does (REST), timing the round trip"""
+        self._begin()
+        action = {"id": str(uuid.uuid4()), "name": name, "payload": payload, "label": label,
+                  "forId": for_id or self.last_message_id}
+        async with self.http.post(f"{self.base_url}/project/action",
+                                  json={"sessionId": self.session_id, "action": action},
+                                  timeout=aiohttp.ClientTimeout(total=self.timeout)) as response:
+            response.raise_for_status()
+        self._finish(flow, streamed=self._emits > 0)
+
+    async def quiz(self, topic):
+        """Take the quiz in either QUIZ_MODE: one Quiz element posting every answer at once
+        (element, the default) or one quiz_answer click per question (buttons)"""
+        self.actions.clear()
+        self.elements.clear()
+
+        def quiz_element():
+            return next((e for e in self.elements if e.get("name") == "Quiz"), None)
+
+        def options():
+            return [a for a in self.actions if a.get("name") == "quiz_answer"]
+
+        await self.click("quiz_request", {"topic": topic, "level": "novice"}, "quiz_request")
+        await self._wait_for(lambda: quiz_element() or options())
+        element = quiz_element()
+        if element is not None:
+            questions = (element.get("props") or {}).get("questions") or []
+            answers = {question["id"]: 0 for question in questions}
+            await self.click("quiz_submit", {"answers": answers}, "quiz_submit", for_id=element.get("forId"))
+            return
+
+        for _ in range(3):
+            if not await self._wait_for(options):
+                break
+            choice = options()[0]
+            self.actions.clear()
+            await self.click("quiz_answer", choice.get("payload", {}), "quiz_answer",
+                             for_id=choice.get("forId"))
+
+    async def run(self, index, turns):
+        flow = "connect"
+        try:
+            await self.connect()
+            flow = "name_prompt"
+            await self.say(f"Tester {index}", flow)
+            for turn in range(turns):
+                flow = "on_message"
+                await self.say(QUESTIONS[(index + turn) % len(QUESTIONS)], flow)
+                flow = "dynamic_suggestion"
+                question = SUGGESTIONS[(index + turn) % len(SUGGESTIONS)]
+                await self.click("dynamic_suggestion", {"question": question}, flow)
+            flow = "quiz"
+            await self.quiz(QUESTIONS[index % len(QUESTIONS)])
+        except Exception as e:
+            self.stats.errors[flow] += 1
+            print(f"user {index}: {flow} failed: {e!r}", file=sys.stderr)
+
+    async def close(self):
+        if self.sio.connected:
+            await self.sio.disconnect()
+        if self.http:
+            await self.http.close()
+
+
+def start_app(port, fake_url, extra_env):
+    """Launch the Chainlit app as a subprocess pointed at the fake Cohere"""
+    env = dict(os.environ, COHERE_API_KEY=os.environ.get("COHERE_API_KEY", "fake-key"), **extra_env)
+    if fake_url:
+        env["COHERE_BASE_URL"] = fake_url
+    return subprocess.Popen(
+        [sys.executable, "-m", "chainlit", "run", "app.py", "--headless", "--port", str(port)],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT,
+    )
+
+
+async def wait_until_up(url, timeout=60):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as http:
+        while time.monotonic() < deadline:
+            try:
+                async with http.get(url) as response:
+                    if response.status < 500:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.25)
+    raise TimeoutError(f"{url} did not come up")
+
+
+def rss(pid):
+    return psutil.Process(pid).memory_info().rss if pid else None
+
+
+async def main_async(args):
+    fake_runner = fake_url = None
+    if not args.no_fake:
+        fake = fake_cohere.stream_from_args(args)
+        fake_runner = await fake_cohere.start(fake, port=args.fake_port)
+        fake_url = f"http://127.0.0.1:{args.fake_port}"
+
+    process = None
+    base_url, pid = args.url, args.pid
+    if not base_url:
+        extra_env = dict(kv.split("=", 1) for kv in args.env)
+        process = start_app(args.port, fake_url, extra_env)
+        base_url, pid = f"http://127.0.0.1:{args.port}", process.pid
+
+    stats = Stats()
+    users = []
+    try:
+        await wait_until_up(base_url)
+        rss_idle = rss(pid)
+
+        # Ramp users up in waves so connection setup doesn't dominate
+        started = time.perf_counter()
+        users = [SimUser(base_url, stats, args.timeout) for _ in range(args.sessions)]
+        tasks = []
+        for index, user in enumerate(users):
+            tasks.append(asyncio.create_task(user.run(index, args.turns)))
+            if args.ramp:
+                await asyncio.sleep(args.ramp / max(1, args.sessions))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+        rss_loaded = rss(pid)
+
+        report = {
+            "sessions": args.sessions,
+            "turns": args.turns,
+            "elapsed_s": round(elapsed, 2),
+            "flows": stats.report(),
+        }
+        if rss_idle and rss_loaded:
+            report["rss_idle_mb"] = round(rss_idle / 2 ** 20, 1)
+            report["rss_loaded_mb"] = round(rss_loaded / 2 ** 20, 1)
+            report["rss_per_session_kb"] = round((rss_loaded - rss_idle) / 1024 / args.sessions, 1)
+        if fake_url:
+            async with aiohttp.ClientSession() as http:
+                async with http.get(f"{fake_url}/stats") as response:
+                    report["upstream"] = await response.json()
+        return report
+    finally:
+        await asyncio.gather(*(user.close() for user in users), return_exceptions=True)
+        if process:
+            process.terminate()
+            process.wait(timeout=10)
+        if fake_runner:
+            await fake_runner.cleanup()
+
+
+def print_report(report):
+    print(f"\n{report['sessions']} sessions x {report['turns']} turns in {report['elapsed_s']}s")
+    header = ("flow", "n", "err", "ttft p50", "p95", "p99", "total p50", "p95", "p99", "emits/ans")
+    print("{:<20}{:>6}{:>5}{:>10}{:>8}{:>8}{:>11}{:>8}{:>8}{:>11}".format(*header))
+    for row in report["flows"]:
+        cells = [row["flow"], row["n"], row["errors"]]
+        cells += [row[f"{m}_p{p}"] for m in ("ttft", "total") for p in (50, 95, 99)]
+        cells.append(row["emits_per_answer"])
+        print("{:<20}{:>6}{:>5}{:>10}{:>8}{:>8}{:>11}{:>8}{:>8}{:>11}".format(
+            *("-" if c is None else c for c in cells)))
+    print("(times in ms)")
+    if "rss_per_session_kb" in report:
+        print(f"RSS idle {report['rss_idle_mb']} MB, loaded {report['rss_loaded_mb']} MB, "
+              f"~{report['rss_per_session_kb']} KB per session")
+    if "upstream" in report:
+        print(f"Upstream LLM requests: {report['upstream']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=2, help="message + suggestion pairs per user")
+    parser.add_argument("--ramp", type=float, default=1.0, help="seconds to start all users")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--port", type=int, default=8765, help="port for the launched app")
+    parser.add_argument("--url", help="use an already running app instead of launching one")
+    parser.add_argument("--pid", type=int, help="server PID for RSS sampling with --url")
+    parser.add_argument("--no-fake", action="store_true", help="don't start the fake Cohere")
+    parser.add_argument("--fake-port", type=int, default=8911)
+    parser.add_argument("--env", action="append", default=[],
+                        help="extra NAME=VALUE for the launched app (repeatable)")
+    parser.add_argument("--json", help="also write the report to this file")
+    fake_cohere.add_arguments(parser)
+    args = parser.parse_args()
+
+    report = asyncio.run(main_async(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# Deterministic ASCII drawings of the Hejla board, filled into the model's [[board ...]] slots
+# (the same pass fills [[name]] with the user's name, so answers stay shareable between users)
+import re
+from functools import lru_cache
+
+SQUARES = 8
+# Bottom row goes 1-4 left to right, top row comes back 5-8 right to left
+ROWS = ((8, 7, 6, 5), (1, 2, 3, 4))
+CELL = 7
+
+# What the model writes instead of drawing, e.g. [[board stone=3 path homes=5,8]], or [[name]]
+MARKER_RE = re.compile(r"\[\[(board|name)([^\]]*)\]\]", re.IGNORECASE)
+SLOTS = ("[[board", "[[name")
+_ARG_RE = re.compile(r"(\w+)(?:=([\w,]+))?")
+
+
+def _cell(number, stone, homes):
+    mark = "*" if number == stone else ("H" if number in homes else " ")
+    return f" {number} {mark}".ljust(CELL)
+
+
+@lru_cache(maxsize=256)
+def render_board(stone=None, path=False, homes=()):
+    """Draw the 8 squares with the stone (*), home squares (H) and optionally the hop path.
+
+    The hop path goes back from 8 to 1 and skips the square holding the stone.
+    """
+    border = "+" + "+".join("-" * CELL for _ in ROWS[0]) + "+"
+    lines = [border]
+    for row in ROWS:
+        lines.append("|" + "|".join(_cell(n, stone, homes) for n in row) + "|")
+        lines.append(border)
+    lines.append("  START here: hop up 1 -> 4, over to 5, then 5 -> 8")
+
+    if path:
+        steps = []
+        for number in range(SQUARES, 0, -1):
+            if number == stone:
+                steps.append(f"({number} skip!)")
+            elif number in homes:
+                steps.append(f"{number}H")
+            else:
+                steps.append(str(number))
+        lines.append("  Hop back: " + " -> ".join(steps) + " -> out")
+    if stone:
+        lines.append(f"  * = stone in square {stone} (never hop on it, kick it out!)")
+    if homes:
+        lines.append("  H = someone's home: the owner can rest, others follow her rules")
+    return "```\n" + "\n".join(lines) + "\n```"
+
+
+def parse_marker(args):
+    """Turn 'stone=3 path homes=5,8' into render_board keyword arguments"""
+    options = {}
+    for name, value in _ARG_RE.findall(args.lower()):
+        if name == "stone" and value.isdigit() and 1 <= int(value) <= SQUARES:
+            options["stone"] = int(value)
+        elif name == "path":
+            options["path"] = value not in ("no", "false", "0")
+        elif name in ("home", "homes") and value:
+            homes = sorted({int(v) for v in value.split(",") if v.isdigit() and 1 <= int(v) <= SQUARES})
+            options["homes"] = tuple(homes)
+    return options
+
+
+def expand_markers(text, name="friend"):
+    """Replace every complete [[board ...]] slot with its drawing and [[name]] with the name"""
+    def fill(m):
+        if m.group(1).lower() == "name":
+            return name
+        return "\n" + render_board(**parse_marker(m.group(2))) + "\n"
+
+    return MARKER_RE.sub(fill, text)
+
+
+class BoardExpander:
+    """Streaming version of expand_markers.
+
+    Holds back text from an opening "[" until the slot is complete (or
+    clearly isn't a slot), so a marker split across chunks still renders.
+    """
+
+    MAX_MARKER = 80
+
+    def __init__(self, name="friend"):
+        self.name = name
+        self._pending = ""
+
+    def feed(self, chunk):
+        """Add a chunk; return the text that is safe to show now"""
+        text = self._pending + chunk
+        self._pending = ""
+        opener = text.rfind("[[")
+        if opener != -1 and "]]" not in text[opener:] and self._could_be_marker(text[opener:]):
+            self._pending = text[opener:]
+            text = text[:opener]
+        elif text.endswith("["):
+            self._pending = "["
+            text = text[:-1]
+        return expand_markers(text, self.name)
+
+    def _could_be_marker(self, tail):
+        tail = tail.lower()
+        return len(tail) < self.MAX_MARKER and any(
+            tail.startswith(slot) or slot.startswith(tail) for slot in SLOTS)
+
+    def close(self):
+        """Return anything still held back at the end of the stream"""
+        text, self._pending = self._pending, ""
+        return expand_markers(text, self.name)
@@ -0,0 +1,73 @@
+# Stop answer streams nobody will read: disconnects, the stop button, superseding messages
+import asyncio
+import metrics
+
+
+class StreamRegistry:
+    """Tracks the answer-streaming task(s) of each session so they can be cancelled.
+
+    Cancelled tasks can look up why (`reason`) to decide whether to finish
+    the message or just stop. Streams that complete feed a running average
+    of answer length, used to estimate how many tokens a cancel saved.
+    """
+
+    def __init__(self, expected_tokens=250, smoothing=0.1):
+        self._tasks = {}
+        self._reasons = {}
+        # Running average of chunks (roughly tokens) in a complete answer
+        self.expected_tokens = expected_tokens
+        self.smoothing = smoothing
+        self.cancelled = 0
+        self.tokens_saved = 0
+
+    def register(self, session_id, task):
+        self._tasks.setdefault(session_id, set()).add(task)
+
+    def unregister(self, session_id, task):
+        tasks = self._tasks.get(session_id)
+        if tasks is not None:
+            tasks.discard(task)
+            if not tasks:
+                del self._tasks[session_id]
+        self._reasons.pop(task, None)
+
+    def cancel(self, session_id, reason):
+        """Cancel the session's running streams; returns how many were cancelled"""
+        count = 0
+        for task in self._tasks.get(session_id, ()):
+            if not task.done() and task not in self._reasons:
+                self._reasons[task] = reason
+                task.cancel()
+                count += 1
+        return count
+
+    def reason(self, task):
+        """Why we cancelled `task` (None if it wasn't us)"""
+        return self._reasons.get(task)
+
+    def completed(self, tokens):
+        """Record the length of an answer that streamed to the end"""
+        self.expected_tokens += self.smoothing * (tokens - self.expected_tokens)
+
+    def record_cancel(self, reason, handler, topic, streamed, upstream_stopped):
+        """Count a cancelled stream and the tokens we didn't have to generate"""
+        saved = max(0, round(self.expected_tokens) - streamed) if upstream_stopped else 0
+        self.cancelled += 1
+        self.tokens_saved += saved
+        metrics.CANCELLED_STREAMS.labels(handler, topic, reason).inc()
+        metrics.TOKENS_SAVED.labels(handler, topic, reason).inc(saved)
+        return saved
+
+    def active(self, session_id):
+        return len(self._tasks.get(session_id, ()))
+
+
+def swallow_cancel():
+    """Undo our own cancel() on the current task once it has been handled"""
+    task = asyncio.current_task()
+    if task is not None:
+        task.uncancel()
+
+
+# Shared registry for the whole process
+streams = StreamRegistry()
@@ -0,0 +1,50 @@
+# Turn composer: gather a turn's text, elements and actions and send them as one message
+import chainlit as cl
+
+
+class TurnComposer:
+    """Collects the pieces of one turn so they cost one message instead of several.
+
+    Each Chainlit message is a websocket emit, a DOM update and (with a data
+    layer) a persistence write, so parts that used to be separate messages
+    (welcome + image + buttons + hint, answer + image + suggestions) are
+    added here and sent, or attached to the streamed answer, together.
+    """
+
+    def __init__(self):
+        self.parts = []
+        self.elements = []
+        self.actions = []
+        # Seconds spent preparing each kind of part ("image", "follow_up"), for metrics
+        self.prepared = {}
+
+    def add(self, text=None, elements=(), actions=()):
+        if text:
+            self.parts.append(text)
+        self.elements.extend(e for e in elements if e is not None)
+        self.actions.extend(actions)
+        return self
+
+    @property
+    def text(self):
+        return "\n\n".join(self.parts)
+
+    def __bool__(self):
+        return bool(self.parts or self.elements or self.actions)
+
+    def message(self):
+        """Everything gathered as a single (unsent) cl.Message"""
+        return cl.Message(content=self.text, elements=list(self.elements), actions=list(self.actions))
+
+    async def send(self):
+        message = self.message()
+        await message.send()
+        return message
+
+    def attach(self, message):
+        """Put the gathered pieces on an existing message before it is sent"""
+        if self.parts:
+            message.content = (message.content + "\n\n" + self.text) if message.content else self.text
+        message.elements = list(message.elements or []) + self.elements
+        message.actions = list(message.actions or []) + self.actions
+        return message
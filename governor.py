@@ -0,0 +1,155 @@
+# Admission control for LLM streams: global cap, fair per-session queue, per-user token buckets
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+import settings
+
+
+class Busy(Exception):
+    """Raised when a request would have to wait longer than the allowed queue time"""
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.updated = time.monotonic()
+
+
+class Governor:
+    """Limits how many LLM streams run at once and how fast each user can start them.
+
+    Waiting requests are queued per session and admitted round-robin, so one
+    user mashing buttons can't starve everyone else. Each session also has a
+    token bucket (`rate` requests per second, bursts of `burst`).
+    """
+
+    def __init__(self, max_inflight=8, rate=10 / 60, burst=4, max_wait=30.0):
+        self.max_inflight = max_inflight
+        self.rate = rate
+        self.burst = burst
+        self.max_wait = max_wait
+        self.active = 0
+        # session id -> deque of waiting futures, in round-robin order
+        self._queues = OrderedDict()
+        self._buckets = {}
+        # (session id, question key) pairs currently being answered
+        self._inflight_questions = set()
+
+    @property
+    def queued(self):
+        return sum(len(waiters) for waiters in self._queues.values())
+
+    def _bucket_wait(self, session_id):
+        """Take a token from the session's bucket; return seconds to wait for it"""
+        bucket = self._buckets.get(session_id)
+        if bucket is None:
+            bucket = self._buckets[session_id] = _Bucket(self.burst)
+        now = time.monotonic()
+        bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+        bucket.updated = now
+        bucket.tokens -= 1
+        if bucket.tokens >= 0:
+            return 0.0
+        return -bucket.tokens / self.rate
+
+    async def _acquire(self, session_id, timeout):
+        if self.active < self.max_inflight and not self._queues:
+            self.active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(session_id, deque()).append(future)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            waiters = self._queues.get(session_id)
+            if waiters and future in waiters:
+                waiters.remove(future)
+                if not waiters:
+                    del self._queues[session_id]
+            if future.done() and not future.cancelled():
+                # Granted just as we gave up: hand the slot on
+                self._release()
+            future.cancel()
+            raise
+
+    def _release(self):
+        self.active -= 1
+        while self.active < self.max_inflight and self._queues:
+            session_id, waiters = self._queues.popitem(last=False)
+            future = waiters.popleft()
+            if waiters:
+                # Back of the line for this session's next request
+                self._queues[session_id] = waiters
+            if not future.done():
+                self.active += 1
+                future.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, session_id, on_queued=None):
+        """Hold one LLM slot for the duration of the block (see acquire)"""
+        await self.acquire(session_id, on_queued)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def acquire(self, session_id, on_queued=None):
+        """Take one LLM slot; give it back with release() when the stream ends.
+
+        `on_queued` is awaited once if the request can't start right away.
+        Raises Busy if the wait would exceed `max_wait`.
+        """
+        started = time.monotonic()
+        wait = self._bucket_wait(session_id)
+        if wait > self.max_wait:
+            self._buckets[session_id].tokens += 1  # refund: the request is refused
+            raise Busy()
+
+        must_queue = wait > 0 or self.active >= self.max_inflight or self._queues
+        if must_queue and on_queued is not None:
+            await on_queued()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+        try:
+            await self._acquire(session_id, self.max_wait - (time.monotonic() - started))
+        except asyncio.TimeoutError:
+            raise Busy()
+
+    def try_acquire_spare(self, headroom=0):
+        """Take a slot for background work only if `headroom` slots stay free and nobody waits"""
+        if self._queues or self.active + headroom >= self.max_inflight:
+            return False
+        self.active += 1
+        return True
+
+    def release(self):
+        """Give back a slot taken with acquire or try_acquire_spare"""
+        self._release()
+
+    def begin_question(self, session_id, key):
+        """Mark a question as being answered; False if it already is (duplicate click)"""
+        item = (session_id, key)
+        if item in self._inflight_questions:
+            return False
+        self._inflight_questions.add(item)
+        return True
+
+    def end_question(self, session_id, key):
+        self._inflight_questions.discard((session_id, key))
+
+    def forget(self, session_id):
+        """Drop per-session state when a chat ends"""
+        self._buckets.pop(session_id, None)
+
+
+# Shared governor for the whole process
+governor = Governor(
+    max_inflight=settings.LLM_MAX_INFLIGHT,
+    rate=settings.LLM_USER_RATE_PER_MIN / 60,
+    burst=settings.LLM_USER_BURST,
+    max_wait=settings.LLM_MAX_QUEUE_WAIT,
+)
@@ -0,0 +1,157 @@
+# Hedged LLM streaming: race a secondary provider when the primary is slow or failing
+import asyncio
+import time
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures; lets one trial through after `reset_after` seconds"""
+
+    def __init__(self, threshold=3, reset_after=30.0):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        # When the current half-open trial was let through
+        self._trial_at = None
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_after:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        """Should the primary be tried for this request?"""
+        state = self.state
+        if state != "half-open":
+            return state == "closed"
+        # One trial at a time; another only if the last one never reported back (e.g. cancelled)
+        now = time.monotonic()
+        if self._trial_at is not None and now - self._trial_at < self.reset_after:
+            return False
+        self._trial_at = now
+        return True
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_at = None
+
+    def failure(self):
+        self._trial_at = None
+        self.failures += 1
+        if self.failures >= self.threshold or self.state == "half-open":
+            self.opened_at = time.monotonic()
+
+
+async def _first(iterator):
+    """Pull the first chunk; None marks an empty stream"""
+    try:
+        return await iterator.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+async def _discard(task, iterator):
+    """Cancel a request's pending first chunk (if any) and close its stream so the connection is freed"""
+    if task is not None:
+        task.cancel()
+        try:
+            await task
+        except (asyncio.CancelledError, Exception):
+            pass
+    try:
+        await iterator.aclose()
+    except Exception:
+        pass
+
+
+class HedgedRunnable:
+    """Streams from the primary runnable, hedging to the secondary if needed.
+
+    If the primary hasn't produced a first chunk after `hedge_after`
+    seconds, the same input is sent to the secondary and whichever starts
+    first wins; the loser is cancelled. While the circuit breaker is open
+    the primary is skipped entirely. Pass a dict as `report` to learn which
+    provider won, why, and how long the first chunk took.
+    """
+
+    def __init__(self, primary, secondary, names=("primary", "secondary"),
+                 hedge_after=2.0, breaker=None):
+        self.primary = primary
+        self.secondary = secondary
+        self.names = names
+        self.hedge_after = hedge_after
+        self.breaker = breaker or CircuitBreaker()
+
+    async def astream(self, input, config=None, report=None, **kwargs):
+        report = {} if report is None else report
+        start = time.perf_counter()
+        primary_name, secondary_name = self.names
+        winner = None
+        # Every request still open, as (first-chunk task or None, stream); whatever is left
+        # here when we stop (finished, failed, cancelled or closed early) is shut down
+        legs = []
+
+        try:
+            if self.breaker.allow():
+                primary = self.primary.astream(input, config, **kwargs).__aiter__()
+                primary_task = asyncio.ensure_future(_first(primary))
+                legs.append((primary_task, primary))
+                done, _ = await asyncio.wait({primary_task}, timeout=self.hedge_after)
+
+                if done and primary_task.exception() is None:
+                    self.breaker.success()
+                    winner = (primary_name, "primary", primary, primary_task.result())
+                elif done:
+                    # Primary failed before its first chunk: fall back
+                    self.breaker.failure()
+                    report["primary_error"] = repr(primary_task.exception())
+                else:
+                    # Primary is slow: hedge and race both
+                    secondary = self.secondary.astream(input, config, **kwargs).__aiter__()
+                    secondary_task = asyncio.ensure_future(_first(secondary))
+                    legs.append((secondary_task, secondary))
+                    racing = {primary_task: (primary_name, primary), secondary_task: (secondary_name, secondary)}
+                    pending = set(racing)
+                    while pending and winner is None:
+                        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                        for task in done:
+                            name, iterator = racing[task]
+                            if task.exception() is None and winner is None:
+                                winner = (name, "hedge", iterator, task.result())
+                            elif task.exception() is not None and task is primary_task:
+                                self.breaker.failure()
+                                report["primary_error"] = repr(task.exception())
+                    if winner is None:
+                        raise secondary_task.exception()
+                    if winner[0] == primary_name:
+                        self.breaker.success()
+                    for task in pending:
+                        await _discard(task, racing[task][1])
+                        legs.remove((task, racing[task][1]))
+            else:
+                report["breaker"] = "open"
+
+            if winner is None:
+                secondary = self.secondary.astream(input, config, **kwargs).__aiter__()
+                legs.append((None, secondary))
+                winner = (secondary_name, "fallback", secondary, await _first(secondary))
+
+            name, reason, iterator, first = winner
+            report.update(provider=name, reason=reason, first_chunk=time.perf_counter() - start)
+            try:
+                if first is not None:
+                    yield first
+                    async for chunk in iterator:
+                        yield chunk
+            except Exception:
+                if name == primary_name:
+                    self.breaker.failure()
+                raise
+        finally:
+            report["total"] = time.perf_counter() - start
+            for task, iterator in legs:
+                await _discard(task, iterator)
@@ -0,0 +1,137 @@
+# Event-loop lag watchdog: measures loop lag, captures stacks of blocking handlers
+import asyncio
+import queue
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+import metrics
+import settings
+
+
+class LoopWatch:
+    """Keeps an eye on the asyncio loop every chat shares.
+
+    A probe task sleeps `interval` seconds over and over; how late it wakes
+    up is the loop lag, kept for percentiles. A watchdog thread notices when
+    the probe hasn't run for `stall_threshold` seconds and captures the loop
+    thread's stack right then, i.e. the stack of whatever handler is blocking.
+    """
+
+    def __init__(self, interval=0.1, stall_threshold=0.25, window=3000, max_stalls=20):
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self._lags = deque(maxlen=window)
+        self.stalls = deque(maxlen=max_stalls)
+        self._beat = time.monotonic()
+        self._loop_thread = None
+        self._probe = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Start watching the running loop (call from inside it)"""
+        if self._probe is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._probe = asyncio.ensure_future(self._run_probe())
+        self._thread = threading.Thread(target=self._watch, name="loopwatch", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._probe is not None:
+            self._probe.cancel()
+            self._probe = None
+        self._stop.set()
+
+    async def _run_probe(self):
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - start - self.interval)
+            self._beat = now
+            self._lags.append(lag)
+            metrics.LOOP_LAG.observe(lag)
+
+    def _watch(self):
+        reported = None
+        while not self._stop.wait(self.stall_threshold / 2):
+            beat = self._beat
+            blocked = time.monotonic() - beat
+            if blocked < self.stall_threshold + self.interval or reported == beat:
+                continue
+            # Report each stall once, with the stack as it is right now
+            reported = beat
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+            self.stalls.append({"time": time.time(), "blocked_for": round(blocked, 3), "stack": stack})
+            metrics.LOOP_STALLS.inc()
+            log(f"Event loop blocked for {blocked * 1000:.0f} ms at:\n{stack}")
+
+    def percentiles(self):
+        """Loop lag over the recent window, in milliseconds"""
+        lags = sorted(self._lags)
+        if not lags:
+            return {"samples": 0}
+
+        def pick(p):
+            return round(lags[min(len(lags) - 1, int(p / 100 * len(lags)))] * 1000, 2)
+
+        return {"samples": len(lags), "p50_ms": pick(50), "p90_ms": pick(90),
+                "p99_ms": pick(99), "max_ms": round(lags[-1] * 1000, 2)}
+
+    def report(self):
+        return {"lag": self.percentiles(), "stall_threshold_ms": self.stall_threshold * 1000,
+                "recent_stalls": list(self.stalls)}
+
+
+_log_queue = None
+
+
+def _log_writer():
+    while True:
+        print(_log_queue.get(), flush=True)
+
+
+def log(message):
+    """print() for the serving path: with BLOCKING_OFFLOAD a background thread does the writing"""
+    global _log_queue
+    if not settings.BLOCKING_OFFLOAD:
+        print(message)
+        return
+    if _log_queue is None:
+        _log_queue = queue.SimpleQueue()
+        threading.Thread(target=_log_writer, name="log-writer", daemon=True).start()
+    _log_queue.put(message)
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """Run known-blocking work (file reads, parsing) off the loop when BLOCKING_OFFLOAD is on"""
+    if settings.BLOCKING_OFFLOAD:
+        return await asyncio.to_thread(fn, *args, **kwargs)
+    return fn(*args, **kwargs)
+
+
+def install(app, path="/debug/loop"):
+    """Serve lag percentiles and recent stall stacks ahead of Chainlit's catch-all route"""
+    from starlette.responses import JSONResponse
+    from starlette.routing import Route
+
+    async def loop_report(request):
+        return JSONResponse(watch.report())
+
+    # Already there if this module was re-imported by a reload
+    if any(getattr(route, "path", None) == path for route in app.router.routes):
+        return
+    app.router.routes.insert(0, Route(path, loop_report, methods=["GET"]))
+
+
+# Shared watchdog for the whole process
+watch = LoopWatch(
+    interval=settings.LOOP_PROBE_INTERVAL,
+    stall_threshold=settings.LOOP_STALL_THRESHOLD,
+)
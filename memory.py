@@ -0,0 +1,133 @@
+# Conversation memory: recent turns verbatim within a token budget, older turns in a rolling summary
+import asyncio
+import hashlib
+import json
+import re
+from agent import get_summarizer
+import settings
+from governor import governor
+from loopwatch import log
+
+# Questions that only make sense with the earlier conversation
+_REFERS_BACK_RE = re.compile(
+    r"\b(?:it|its|that|those|they|them|again|more|another|else|same|earlier|before|previous|"
+    r"you said|you mean|what about|how about)\b"
+)
+SHORT_QUESTION_WORDS = 3
+
+
+def estimate_tokens(text):
+    """Rough token count (about 4 characters per token) without loading a tokenizer"""
+    return len(text) // 4 + 1
+
+
+def refers_back(question):
+    """True for follow-ups like "why?" or "can you show that again" """
+    text = question.lower()
+    return len(text.split()) <= SHORT_QUESTION_WORDS or bool(_REFERS_BACK_RE.search(text))
+
+
+class ConversationMemory:
+    """Decides what each session's prompt remembers, keeping its size flat.
+
+    The newest `turns` turns that fit in `token_budget` go into the prompt
+    verbatim, after the session's rolling summary. Older turns wait in the
+    session history until `fold_turns` of them have piled up, then a
+    background task folds them into the summary. Folding only takes spare
+    LLM capacity (like prefetching), so it never delays anyone's answer.
+    """
+
+    def __init__(self, summarizer_factory, mode="auto", turns=4, token_budget=1000, fold_turns=3,
+                 summary_tokens=150, headroom=2):
+        self.summarizer_factory = summarizer_factory
+        self.mode = mode
+        self.turns = turns
+        self.token_budget = token_budget
+        self.fold_turns = fold_turns
+        self.summary_words = max(20, summary_tokens * 3 // 4)
+        self.headroom = headroom
+        self._folding = {}
+        self.folds = 0
+
+    def window(self, state):
+        """The newest turns that fit in both the turn count and the token budget"""
+        kept = []
+        used = 0
+        for question, answer in reversed(state.history[-self.turns:] if self.turns else ()):
+            used += estimate_tokens(question) + estimate_tokens(answer)
+            if used > self.token_budget:
+                break
+            kept.append((question, answer))
+        kept.reverse()
+        return kept
+
+    def messages(self, state, question):
+        """History messages for this question's prompt ([] when it stands alone)"""
+        if self.mode == "off" or (self.mode == "auto" and not refers_back(question)):
+            return []
+        messages = [("system", f"Earlier in this chat: {state.summary}")] if state.summary else []
+        for asked, answered in self.window(state):
+            messages += [("human", asked), ("ai", answered)]
+        return messages
+
+    def scope(self, scope, messages):
+        """Answers given with memory only match the same conversation so far"""
+        if not messages:
+            return scope
+        digest = hashlib.sha1(json.dumps(messages).encode()).hexdigest()[:12]
+        return f"{scope}:memory:{digest}"
+
+    def pending(self, state):
+        """Turns that fell out of the verbatim window and aren't summarized yet"""
+        return state.history[:len(state.history) - len(self.window(state))]
+
+    def schedule_fold(self, session_id, state, on_done=None):
+        """Fold old turns into the summary in the background once enough have piled up"""
+        if self.mode == "off" or session_id in self._folding:
+            return
+        pending = self.pending(state)
+        if len(pending) < self.fold_turns:
+            return
+        task = asyncio.ensure_future(self._fold(state, pending, on_done))
+        self._folding[session_id] = task
+        task.add_done_callback(lambda _: self._folding.pop(session_id, None))
+
+    async def _fold(self, state, pending, on_done):
+        # No spare capacity: try again after the next turn (history is capped meanwhile)
+        if not governor.try_acquire_spare(self.headroom):
+            return
+        try:
+            turns = "\n".join(f"Player: {question}\nZola: {answer}" for question, answer in pending)
+            summary = await self.summarizer_factory().ainvoke(
+                {"summary": state.summary or "(nothing yet)", "turns": turns, "words": self.summary_words}
+            )
+        except Exception as e:
+            log(f"Error summarizing conversation: {e}")
+            return
+        finally:
+            governor.release()
+
+        # Turns added while we were summarizing stay; only the folded ones leave
+        if state.history[:len(pending)] == pending:
+            del state.history[:len(pending)]
+        state.summary = summary.strip()
+        self.folds += 1
+        if on_done is not None:
+            await on_done()
+
+    async def close(self):
+        for task in list(self._folding.values()):
+            task.cancel()
+        self._folding.clear()
+
+
+# Shared memory policy for the whole process (the memory itself lives in each SessionState)
+memory = ConversationMemory(
+    get_summarizer,
+    mode=settings.MEMORY_MODE,
+    turns=settings.MEMORY_TURNS,
+    token_budget=settings.MEMORY_TOKEN_BUDGET,
+    fold_turns=settings.MEMORY_FOLD_TURNS,
+    summary_tokens=settings.MEMORY_SUMMARY_TOKENS,
+    headroom=settings.MEMORY_HEADROOM,
+)
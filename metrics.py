@@ -0,0 +1,150 @@
+# Per-turn latency/throughput metrics, exported Prometheus-style on /metrics
+import time
+from contextlib import contextmanager
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from starlette.responses import Response
+from starlette.routing import Route
+
+# Buckets tuned for chat: sub-millisecond local work up to long streamed answers
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+SLOW_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 8.0, 13.0, 21.0, 34.0, 60.0)
+# Sends and actions: usually fast, occasionally stuck behind a slow client
+SEND_BUCKETS = FAST_BUCKETS + SLOW_BUCKETS[6:]
+RATE_BUCKETS = (5, 10, 20, 30, 40, 50, 75, 100, 150, 200, 400)
+
+LABELS = ("handler", "topic")
+
+
+def _metric(kind, name, *args, **kwargs):
+    """Create a metric, or reuse the one registered by an earlier import.
+
+    `chainlit run -w` re-imports the app modules on every edit, and
+    prometheus_client refuses to register the same name twice.
+    """
+    existing = REGISTRY._names_to_collectors.get(name)
+    if existing is not None:
+        return existing
+    return kind(name, *args, **kwargs)
+
+
+PROMPT_BUILD = _metric(Histogram, "zola_prompt_build_seconds", "Time to format the chat prompt",
+                       LABELS, buckets=FAST_BUCKETS)
+FIRST_CHUNK = _metric(Histogram, "zola_first_chunk_seconds", "Time from request to first LLM chunk",
+                      LABELS, buckets=SLOW_BUCKETS)
+STREAM_TIME = _metric(Histogram, "zola_stream_seconds", "Total time streaming one answer",
+                      LABELS, buckets=SLOW_BUCKETS)
+TOKENS_PER_SECOND = _metric(Histogram, "zola_tokens_per_second", "Streamed chunks per second after the first",
+                            LABELS, buckets=RATE_BUCKETS)
+IMAGE_SEND = _metric(Histogram, "zola_image_send_seconds", "Time to prepare and send the topic image",
+                     LABELS, buckets=SEND_BUCKETS)
+FOLLOW_UP = _metric(Histogram, "zola_follow_up_seconds", "Time to prepare and send follow-up suggestions",
+                    LABELS, buckets=SEND_BUCKETS)
+QUIZ_ACTION = _metric(Histogram, "zola_quiz_action_seconds", "Time to handle a quiz action",
+                      LABELS, buckets=SEND_BUCKETS)
+
+TURNS = _metric(Counter, "zola_turns_total", "Answered turns by source (llm, shared, cache or prefetch)", LABELS + ("source",))
+STREAM_CHUNKS = _metric(Counter, "zola_stream_chunks_total", "Chunks streamed to users", LABELS)
+TURN_ERRORS = _metric(Counter, "zola_turn_errors_total", "Turns that failed while streaming", LABELS)
+CANCELLED_STREAMS = _metric(Counter, "zola_cancelled_streams_total", "Answer streams stopped early, by reason",
+                            LABELS + ("reason",))
+TOKENS_SAVED = _metric(Counter, "zola_tokens_saved_total", "Estimated tokens not generated thanks to cancellation",
+                       LABELS + ("reason",))
+
+PROVIDER_WINS = _metric(Counter, "zola_llm_provider_wins_total", "Which provider served each hedged stream",
+                        ("provider", "reason"))
+PROVIDER_FIRST_CHUNK = _metric(Histogram, "zola_llm_provider_first_chunk_seconds",
+                               "Time to the winning provider's first chunk", ("provider",),
+                               buckets=SLOW_BUCKETS)
+
+LOOP_LAG = _metric(Histogram, "zola_event_loop_lag_seconds", "How late the event loop ran a 100 ms probe",
+                   buckets=SEND_BUCKETS)
+LOOP_STALLS = _metric(Counter, "zola_event_loop_stalls_total", "Times a handler blocked the event loop past the threshold")
+
+PERSIST_QUEUE = _metric(Gauge, "zola_persist_queue_depth", "Conversation writes waiting to be flushed to disk")
+PERSIST_DROPPED = _metric(Counter, "zola_persist_dropped_total", "Conversation writes dropped because the queue was full")
+PERSIST_FLUSH = _metric(Histogram, "zola_persist_flush_seconds", "Time to commit one batch of conversation writes",
+                        buckets=SEND_BUCKETS)
+
+ACTIVE_SESSIONS = _metric(Gauge, "zola_active_sessions", "Connected chat sessions")
+INFLIGHT_STREAMS = _metric(Gauge, "zola_inflight_llm_streams", "LLM streams currently running")
+
+
+@contextmanager
+def timed(histogram, handler, topic="none"):
+    """Observe the duration of the with-block"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.labels(handler, topic).observe(time.perf_counter() - start)
+
+
+class StreamTimer:
+    """Measures first-chunk latency, chunk rate and total time of one stream"""
+
+    def __init__(self, handler, topic):
+        self.handler = handler
+        self.topic = topic
+        self.start = time.perf_counter()
+        self.first = None
+        self.chunks = 0
+
+    def chunk(self):
+        if self.first is None:
+            self.first = time.perf_counter()
+            FIRST_CHUNK.labels(self.handler, self.topic).observe(self.first - self.start)
+        self.chunks += 1
+
+    def finish(self, source="llm"):
+        end = time.perf_counter()
+        STREAM_TIME.labels(self.handler, self.topic).observe(end - self.start)
+        STREAM_CHUNKS.labels(self.handler, self.topic).inc(self.chunks)
+        TURNS.labels(self.handler, self.topic, source).inc()
+        if self.first is not None and self.chunks > 1 and end > self.first:
+            TOKENS_PER_SECOND.labels(self.handler, self.topic).observe((self.chunks - 1) / (end - self.first))
+
+
+_prompt_timer_class = None
+
+
+def prompt_timer(handler, topic):
+    """LangChain callback that times the prompt-template step of the chain.
+
+    The class is defined on first use so importing this module doesn't pull
+    in LangChain before the server is up.
+    """
+    global _prompt_timer_class
+    if _prompt_timer_class is None:
+        from langchain_core.callbacks import BaseCallbackHandler
+
+        class PromptTimer(BaseCallbackHandler):
+            run_inline = True
+
+            def __init__(self, handler, topic):
+                self.handler = handler
+                self.topic = topic
+                self._starts = {}
+
+            def on_chain_start(self, serialized, inputs, *, run_id, **kwargs):
+                if kwargs.get("name") == "ChatPromptTemplate":
+                    self._starts[run_id] = time.perf_counter()
+
+            def on_chain_end(self, outputs, *, run_id, **kwargs):
+                start = self._starts.pop(run_id, None)
+                if start is not None:
+                    PROMPT_BUILD.labels(self.handler, self.topic).observe(time.perf_counter() - start)
+
+        _prompt_timer_class = PromptTimer
+    return _prompt_timer_class(handler, topic)
+
+
+async def metrics_endpoint(request):
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+def install(app, path="/metrics"):
+    """Serve /metrics ahead of Chainlit's catch-all frontend route"""
+    # Already there if this module was re-imported by a reload
+    if any(getattr(route, "path", None) == path for route in app.router.routes):
+        return
+    app.router.routes.insert(0, Route(path, metrics_endpoint, methods=["GET"]))
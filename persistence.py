@@ -0,0 +1,370 @@
+# SQLite-backed Chainlit data layer with an async write-behind queue
+import asyncio
+import json
+import sqlite3
+import time
+import uuid
+from datetime import datetime, timezone
+import chainlit as cl
+from chainlit.data.base import BaseDataLayer
+from chainlit.data.utils import queue_until_user_message
+from chainlit.types import PageInfo, PaginatedResponse
+from chainlit.user import PersistedUser
+import metrics
+import settings
+from batching import run_batches
+from loopwatch import log
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY, identifier TEXT UNIQUE NOT NULL, metadata TEXT, createdAt TEXT);
+CREATE TABLE IF NOT EXISTS threads (
+    id TEXT PRIMARY KEY, createdAt TEXT, name TEXT, userId TEXT, userIdentifier TEXT,
+    tags TEXT, metadata TEXT);
+CREATE TABLE IF NOT EXISTS steps (
+    id TEXT PRIMARY KEY, threadId TEXT, parentId TEXT, createdAt TEXT, data TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS steps_thread ON steps (threadId, createdAt);
+CREATE TABLE IF NOT EXISTS elements (
+    id TEXT PRIMARY KEY, threadId TEXT, forId TEXT, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS feedbacks (
+    id TEXT PRIMARY KEY, forId TEXT, threadId TEXT, value INTEGER, comment TEXT);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, threadId TEXT, kind TEXT, data TEXT, createdAt TEXT);
+CREATE INDEX IF NOT EXISTS events_kind ON events (kind, createdAt);
+"""
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _dumps(value):
+    return None if value is None else json.dumps(value, default=str)
+
+
+def _loads(value, default=None):
+    return default if value is None else json.loads(value)
+
+
+class WriteBehind:
+    """Bounded in-memory queue of SQL writes, flushed in batched transactions.
+
+    Callers only enqueue (never waiting on disk); a background task takes up
+    to `batch_size` writes, or whatever arrived within `flush_interval`, and
+    commits them in one transaction on a worker thread. When the queue is
+    full, new writes are dropped and counted rather than slowing a turn down.
+    """
+
+    def __init__(self, path, batch_size=100, flush_interval=0.5, max_queue=10000):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self._queue = None
+        self._worker = None
+        # Writes accepted and writes processed (committed or failed), in queue order;
+        # _progress is replaced after every batch to wake readers waiting on a barrier
+        self._queued = 0
+        self._processed = 0
+        self._progress = asyncio.Event()
+        self.written = 0
+        self.dropped = 0
+
+    def connect(self):
+        db = sqlite3.connect(self.path, timeout=10)
+        db.row_factory = sqlite3.Row
+        return db
+
+    def init_schema(self):
+        with self.connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(SCHEMA)
+
+    def put(self, sql, params=()):
+        """Queue one write; returns False if it had to be dropped"""
+        if self._queue is None:
+            self._queue = asyncio.Queue(self.max_queue)
+            self._worker = asyncio.ensure_future(self._run())
+        try:
+            self._queue.put_nowait((sql, params))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            metrics.PERSIST_DROPPED.inc()
+            return False
+        self._queued += 1
+        metrics.PERSIST_QUEUE.set(self._queue.qsize())
+        return True
+
+    async def _run(self):
+        await run_batches(self._queue, self.batch_size, self.flush_interval, self._flush_batch,
+                          self._flush_now)
+
+    async def _flush_batch(self, batch):
+        start = time.perf_counter()
+        try:
+            await asyncio.to_thread(self._commit, batch)
+        except Exception as e:
+            log(f"Error persisting {len(batch)} writes: {e}")
+        finally:
+            self._processed_batch(batch)
+            metrics.PERSIST_FLUSH.observe(time.perf_counter() - start)
+            metrics.PERSIST_QUEUE.set(self._queue.qsize())
+
+    def _flush_now(self, batch):
+        # Shutting down mid-batch: commit what we already took off the queue
+        self._commit(batch)
+        self._processed_batch(batch)
+
+    def _processed_batch(self, batch):
+        self._processed += len(batch)
+        self._progress.set()
+        self._progress = asyncio.Event()
+
+    def _commit(self, batch):
+        with self.connect() as db:
+            for sql, params in batch:
+                db.execute(sql, params)
+        self.written += len(batch)
+
+    async def barrier(self):
+        """Wait until the writes queued before this call are processed.
+
+        Writes queued afterwards aren't waited for, so a read can't be held
+        up indefinitely by a steady stream of new writes.
+        """
+        target = self._queued
+        while self._processed < target:
+            await self._progress.wait()
+
+    async def close(self):
+        """Flush what's left and stop the background task (on shutdown)"""
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self.barrier(), settings.DATA_SHUTDOWN_TIMEOUT)
+        except asyncio.TimeoutError:
+            log(f"Persistence flush timed out with {self._queue.qsize()} writes queued")
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        # Anything that raced in after the barrier
+        rest = []
+        while not self._queue.empty():
+            rest.append(self._queue.get_nowait())
+        if rest:
+            await asyncio.to_thread(self._commit, rest)
+            self._processed_batch(rest)
+
+
+class SQLiteDataLayer(BaseDataLayer):
+    """Chainlit data layer on a local SQLite file.
+
+    Messages, steps, elements, feedback and app events (quiz results,
+    clicked suggestions) go through the write-behind queue, so persisting
+    never adds latency to a turn. Reads wait for pending writes first.
+    """
+
+    def __init__(self, path, batch_size=100, flush_interval=0.5, max_queue=10000):
+        self.writes = WriteBehind(path, batch_size, flush_interval, max_queue)
+        self.writes.init_schema()
+
+    async def _read(self, fn, *args):
+        await self.writes.barrier()
+        return await asyncio.to_thread(fn, *args)
+
+    # Users (rare, and login needs the row back, so these are written directly)
+    def _get_user(self, identifier):
+        with self.writes.connect() as db:
+            row = db.execute("SELECT * FROM users WHERE identifier = ?", (identifier,)).fetchone()
+        if row is None:
+            return None
+        return PersistedUser(id=row["id"], identifier=row["identifier"],
+                             metadata=_loads(row["metadata"], {}), createdAt=row["createdAt"])
+
+    def _create_user(self, user):
+        with self.writes.connect() as db:
+            db.execute("INSERT INTO users (id, identifier, metadata, createdAt) VALUES (?, ?, ?, ?) "
+                       "ON CONFLICT(identifier) DO UPDATE SET metadata = excluded.metadata",
+                       (str(uuid.uuid4()), user.identifier, _dumps(user.metadata), _now()))
+        return self._get_user(user.identifier)
+
+    async def get_user(self, identifier):
+        return await asyncio.to_thread(self._get_user, identifier)
+
+    async def create_user(self, user):
+        return await asyncio.to_thread(self._create_user, user)
+
+    # Feedback
+    async def upsert_feedback(self, feedback):
+        feedback_id = feedback.id or str(uuid.uuid4())
+        self.writes.put("INSERT OR REPLACE INTO feedbacks (id, forId, threadId, value, comment) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (feedback_id, feedback.forId, feedback.threadId, feedback.value, feedback.comment))
+        return feedback_id
+
+    async def delete_feedback(self, feedback_id):
+        self.writes.put("DELETE FROM feedbacks WHERE id = ?", (feedback_id,))
+        return True
+
+    # Elements (our images are URL references, so only the metadata is stored)
+    @queue_until_user_message()
+    async def create_element(self, element):
+        data = element.to_dict()
+        self.writes.put("INSERT OR REPLACE INTO elements (id, threadId, forId, data) VALUES (?, ?, ?, ?)",
+                        (data["id"], data.get("threadId"), data.get("forId"), _dumps(data)))
+
+    async def get_element(self, thread_id, element_id):
+        def fetch():
+            with self.writes.connect() as db:
+                row = db.execute("SELECT data FROM elements WHERE id = ? AND threadId = ?",
+                                 (element_id, thread_id)).fetchone()
+            return _loads(row["data"]) if row else None
+
+        return await self._read(fetch)
+
+    @queue_until_user_message()
+    async def delete_element(self, element_id, thread_id=None):
+        self.writes.put("DELETE FROM elements WHERE id = ?", (element_id,))
+
+    # Steps (messages are steps too)
+    def _put_step(self, step_dict):
+        thread_id = step_dict.get("threadId")
+        created = step_dict.get("createdAt") or _now()
+        self.writes.put("INSERT OR IGNORE INTO threads (id, createdAt) VALUES (?, ?)", (thread_id, created))
+        self.writes.put("INSERT OR REPLACE INTO steps (id, threadId, parentId, createdAt, data) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (step_dict["id"], thread_id, step_dict.get("parentId"), created, _dumps(step_dict)))
+
+    @queue_until_user_message()
+    async def create_step(self, step_dict):
+        self._put_step(step_dict)
+
+    @queue_until_user_message()
+    async def update_step(self, step_dict):
+        self._put_step(step_dict)
+
+    @queue_until_user_message()
+    async def delete_step(self, step_id):
+        self.writes.put("DELETE FROM steps WHERE id = ?", (step_id,))
+
+    # Threads
+    async def update_thread(self, thread_id, name=None, user_id=None, metadata=None, tags=None):
+        user_identifier = None
+        if user_id is not None:
+            user = cl.user_session.get("user") if cl.context.session else None
+            user_identifier = getattr(user, "identifier", None)
+        self.writes.put(
+            "INSERT INTO threads (id, createdAt, name, userId, userIdentifier, tags, metadata) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(id) DO UPDATE SET "
+            "name = COALESCE(excluded.name, name), userId = COALESCE(excluded.userId, userId), "
+            "userIdentifier = COALESCE(excluded.userIdentifier, userIdentifier), "
+            "tags = COALESCE(excluded.tags, tags), metadata = COALESCE(excluded.metadata, metadata)",
+            (thread_id, _now(), name, user_id, user_identifier, _dumps(tags), _dumps(metadata)))
+
+    async def delete_thread(self, thread_id):
+        for table, column in (("steps", "threadId"), ("elements", "threadId"),
+                              ("feedbacks", "threadId"), ("threads", "id")):
+            self.writes.put(f"DELETE FROM {table} WHERE {column} = ?", (thread_id,))
+
+    async def get_thread_author(self, thread_id):
+        def fetch():
+            with self.writes.connect() as db:
+                row = db.execute("SELECT userIdentifier FROM threads WHERE id = ?", (thread_id,)).fetchone()
+            return row["userIdentifier"] if row else None
+
+        return await self._read(fetch)
+
+    def _thread_dict(self, db, row):
+        steps = [_loads(r["data"]) for r in db.execute(
+            "SELECT data FROM steps WHERE threadId = ? ORDER BY createdAt", (row["id"],))]
+        feedback = {r["forId"]: {"id": r["id"], "forId": r["forId"], "value": r["value"], "comment": r["comment"]}
+                    for r in db.execute("SELECT * FROM feedbacks WHERE threadId = ?", (row["id"],))}
+        for step in steps:
+            if step["id"] in feedback:
+                step["feedback"] = feedback[step["id"]]
+        elements = [_loads(r["data"]) for r in db.execute(
+            "SELECT data FROM elements WHERE threadId = ?", (row["id"],))]
+        return {
+            "id": row["id"], "createdAt": row["createdAt"], "name": row["name"],
+            "userId": row["userId"], "userIdentifier": row["userIdentifier"],
+            "tags": _loads(row["tags"], []), "metadata": _loads(row["metadata"], {}),
+            "steps": steps, "elements": elements,
+        }
+
+    async def get_thread(self, thread_id):
+        def fetch():
+            with self.writes.connect() as db:
+                row = db.execute("SELECT * FROM threads WHERE id = ?", (thread_id,)).fetchone()
+                return self._thread_dict(db, row) if row else None
+
+        return await self._read(fetch)
+
+    async def list_threads(self, pagination, filters):
+        def fetch():
+            sql = "SELECT * FROM threads WHERE 1 = 1"
+            params = []
+            if filters.userId:
+                sql += " AND userId = ?"
+                params.append(filters.userId)
+            if filters.search:
+                sql += " AND name LIKE ?"
+                params.append(f"%{filters.search}%")
+            if pagination.cursor:
+                sql += " AND createdAt < (SELECT createdAt FROM threads WHERE id = ?)"
+                params.append(pagination.cursor)
+            sql += " ORDER BY createdAt DESC LIMIT ?"
+            params.append(pagination.first + 1)
+            with self.writes.connect() as db:
+                rows = db.execute(sql, params).fetchall()
+                threads = [self._thread_dict(db, row) for row in rows[:pagination.first]]
+            return PaginatedResponse(
+                data=threads,
+                pageInfo=PageInfo(hasNextPage=len(rows) > pagination.first,
+                                  startCursor=threads[0]["id"] if threads else None,
+                                  endCursor=threads[-1]["id"] if threads else None),
+            )
+
+        return await self._read(fetch)
+
+    # App events: quiz results, clicked suggestions
+    def record_event(self, kind, thread_id=None, **data):
+        self.writes.put("INSERT INTO events (threadId, kind, data, createdAt) VALUES (?, ?, ?, ?)",
+                        (thread_id, kind, _dumps(data), _now()))
+
+    def build_debug_url(self):
+        return ""
+
+    async def close(self):
+        await self.writes.close()
+
+
+_data_layer = None
+
+
+def get_data_layer():
+    """The process-wide SQLite data layer (None when DATA_LAYER is off)"""
+    global _data_layer
+    if _data_layer is None and settings.DATA_LAYER == "sqlite":
+        _data_layer = SQLiteDataLayer(
+            settings.DATA_DB_PATH,
+            batch_size=settings.DATA_BATCH_SIZE,
+            flush_interval=settings.DATA_FLUSH_INTERVAL,
+            max_queue=settings.DATA_MAX_QUEUE,
+        )
+    return _data_layer
+
+
+def record(kind, **data):
+    """Persist an app event for the current conversation (no-op without a data layer)"""
+    data_layer = get_data_layer()
+    if data_layer is not None:
+        data_layer.record_event(kind, thread_id=cl.context.session.thread_id, **data)
+
+
+async def close():
+    if _data_layer is not None:
+        await _data_layer.close()
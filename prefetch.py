@@ -0,0 +1,170 @@
+# Speculative prefetch: answer the offered follow-ups while the user is still reading
+import asyncio
+import time
+from collections import OrderedDict
+import settings
+from agent import get_runnable
+from answer_cache import answer_cache, normalize
+from cancellation import streams
+from governor import governor
+from singleflight import single_flight
+import prompts
+from loopwatch import log
+
+
+class Prefetcher:
+    """Generates answers to suggested follow-ups in the background, into the answer cache.
+
+    Strictly low priority: a job only starts when the governor has
+    `headroom` slots to spare and nobody is queued, and prefetches never
+    wait in the governor queue. Spending is capped per session
+    (`session_tokens`) and globally (`global_tokens_per_min`, a token
+    bucket). A newer offer from the same session replaces its pending jobs,
+    and a session's jobs are dropped when it ends. Running prefetches go
+    through single-flight, so a click on a suggestion that is still being
+    prefetched joins the stream instead of starting another.
+    """
+
+    def __init__(self, runnable_factory, session_tokens=1500, global_tokens_per_min=20000,
+                 concurrency=2, headroom=2, poll_interval=0.25):
+        self.runnable_factory = runnable_factory
+        self.session_tokens = session_tokens
+        self.global_tokens_per_min = global_tokens_per_min
+        self.concurrency = concurrency
+        self.headroom = headroom
+        self.poll_interval = poll_interval
+        # session id -> list of (question, user level) waiting, oldest session first
+        self._pending = OrderedDict()
+        self._spent = {}
+        self._running = set()
+        self._global = global_tokens_per_min
+        self._refilled = time.monotonic()
+        self._worker = None
+        # Questions we prefetched that haven't been asked yet (oldest first, capped)
+        self._unused = OrderedDict()
+        self.started = 0
+        self.completed = 0
+        self.used = 0
+        self.skipped = 0
+
+    def offer(self, session_id, questions, user_level="novice"):
+        """Queue the follow-ups just offered to a session (replacing older ones)"""
+        wanted = [(q, user_level) for q in questions if not self._known(q, user_level)]
+        self._pending.pop(session_id, None)
+        if wanted:
+            self._pending[session_id] = wanted
+            if self._worker is None or self._worker.done():
+                self._worker = asyncio.ensure_future(self._run())
+
+    def forget(self, session_id):
+        """Drop a session's pending jobs and budget when its chat ends"""
+        self._pending.pop(session_id, None)
+        self._spent.pop(session_id, None)
+
+    def mark_used(self, question, scope):
+        """Count a cache hit that a prefetch produced"""
+        key = (scope, normalize(question))
+        if self._unused.pop(key, None) is not None:
+            self.used += 1
+            return True
+        return False
+
+    @staticmethod
+    def _keys(question, user_level):
+        scope = prompts.scope(prompts.classify_intent(question), user_level)
+        return scope, f"{scope}:{normalize(question)}"
+
+    def _known(self, question, user_level):
+        """Already cached or being streamed right now"""
+        scope, flight_key = self._keys(question, user_level)
+        return answer_cache.has(question, scope) or single_flight.get(flight_key) is not None
+
+    def _estimate(self):
+        return max(1, round(streams.expected_tokens))
+
+    def _refill(self):
+        now = time.monotonic()
+        self._global = min(self.global_tokens_per_min,
+                           self._global + (now - self._refilled) * self.global_tokens_per_min / 60)
+        self._refilled = now
+
+    def _next_job(self):
+        """Pop the next affordable job, round-robin over sessions"""
+        estimate = self._estimate()
+        for session_id in list(self._pending):
+            questions = self._pending.pop(session_id)
+            if self._spent.get(session_id, 0) + estimate > self.session_tokens:
+                self.skipped += len(questions)
+                continue
+            question, user_level = questions.pop(0)
+            if questions:
+                self._pending[session_id] = questions
+            if self._known(question, user_level):
+                continue
+            return session_id, question, user_level, estimate
+        return None
+
+    async def _run(self):
+        while self._pending or self._running:
+            self._refill()
+            while (self._pending and len(self._running) < self.concurrency
+                   and self._global >= self._estimate()
+                   and governor.try_acquire_spare(self.headroom)):
+                job = self._next_job()
+                if job is None:
+                    governor.release()
+                    break
+                session_id, question, user_level, estimate = job
+                # Reserve the estimate now; settled with the real size when done
+                self._spent[session_id] = self._spent.get(session_id, 0) + estimate
+                self._global -= estimate
+                task = asyncio.ensure_future(self._prefetch(session_id, question, user_level, estimate))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+            await asyncio.sleep(self.poll_interval)
+
+    async def _prefetch(self, session_id, question, user_level, estimate):
+        self.started += 1
+        chunks = []
+        intent = prompts.classify_intent(question)
+        scope, flight_key = self._keys(question, user_level)
+        release = governor.release
+        try:
+            runnable = self.runnable_factory(prompts.model_intent(intent))
+            upstream = runnable.astream(prompts.build_context(question, user_level))
+            # The flight gives the slot back when its upstream ends (at once if it's a duplicate)
+            flight = single_flight.start(flight_key, upstream, on_release=release)
+            release = None
+            async for chunk in flight.follow():
+                chunks.append(chunk)
+            answer_cache.put(question, chunks, scope)
+            self._unused[(scope, normalize(question))] = True
+            while len(self._unused) > answer_cache.max_size:
+                self._unused.popitem(last=False)
+            self.completed += 1
+        except Exception as e:
+            log(f"Error prefetching {question!r}: {e}")
+        finally:
+            if release is not None:
+                release()
+            actual = len(chunks)
+            if session_id in self._spent:
+                self._spent[session_id] += actual - estimate
+            self._global += estimate - actual
+
+    async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+        for task in list(self._running):
+            task.cancel()
+        self._pending.clear()
+
+
+# Shared prefetcher for the whole process
+prefetcher = Prefetcher(
+    get_runnable,
+    session_tokens=settings.PREFETCH_SESSION_TOKENS,
+    global_tokens_per_min=settings.PREFETCH_GLOBAL_TOKENS_PER_MIN,
+    concurrency=settings.PREFETCH_CONCURRENCY,
+    headroom=settings.PREFETCH_HEADROOM,
+)
@@ -0,0 +1,133 @@
+# Intent-aware prompts: a compact system prompt and an output cap per kind of question
+import re
+from functools import lru_cache
+import settings
+
+# Kinds of question we answer differently
+QUICK = "quick"
+EXPLAIN = "explain"
+OFF_TOPIC = "off_topic"
+INTENTS = (QUICK, EXPLAIN, OFF_TOPIC)
+
+# Any of these means the question is (probably) about Hejla or play in general
+_ON_TOPIC_RE = re.compile(
+    r"\b(?:hejla|hopscotch|sudan|game|play|hop|square|stone|chalk|foot|feet|girl|boy|kid|child|"
+    r"school|homes?\b|win|rule|turn|line|zola|fun|friend)"
+)
+# Only deflect locally when the question is clearly about something else
+_OFF_TOPIC_RE = re.compile(
+    r"\b(?:weather|news|politic|president|election|coding|code|program|python|javascript|math|"
+    r"homework|equation|recipe|cook|movie|film|song|music|football|soccer|stock|crypto|bitcoin|"
+    r"translate|essay|capital of|celebrit)"
+)
+# Questions that need a walkthrough rather than a one-liner
+_EXPLAIN_RE = re.compile(
+    r"\b(?:how(?! (?:many|much|long|old|often)\b)|why|explain|describe|tell me|step|rules|teach|"
+    r"walk me|history|origin)"
+)
+QUICK_MAX_WORDS = 14
+
+# Answered without calling the model
+OFF_TOPIC_REPLY = "Haha, let's stick to Hejla! Any questions about hopping? 😄🦶"
+
+
+@lru_cache(maxsize=1024)
+def classify_intent(text):
+    """quick, explain or off_topic, from the wording of the question"""
+    text = text.lower()
+    if not _ON_TOPIC_RE.search(text) and _OFF_TOPIC_RE.search(text):
+        return OFF_TOPIC
+    if _EXPLAIN_RE.search(text) or len(text.split()) > QUICK_MAX_WORDS:
+        return EXPLAIN
+    return QUICK
+
+
+def model_intent(intent):
+    """The chain used for an intent (off-topic falls back to quick when not deflected locally)"""
+    return intent if intent in SYSTEM_PROMPTS else QUICK
+
+
+def max_tokens(intent):
+    """Output cap for an intent (None means no cap)"""
+    return {QUICK: settings.MAX_TOKENS_QUICK, EXPLAIN: settings.MAX_TOKENS_EXPLAIN}.get(intent) or None
+
+
+# Shared by every variant: who Zola is and the facts she may rely on
+_PERSONA = (
+    "You are Zola, a friendly Sudanese girl who grew up playing Hejla (Sudanese hopscotch) "
+    "with her sisters. Chat like a friend: casual, warm, 1-2 emojis, no lectures.\n"
+    "You're talking to a {user_level} player. Their name is written as [[name]] "
+    "(the app fills it in); use it at most once.\n\n"
+    "Hejla facts: 8 connected squares numbered 1-8, drawn with chalk or scratched in dirt. "
+    "Throw a stone into each square in order, hop on one foot (never both), hop back from 8 to 1 "
+    "skipping the stone's square, kick the stone out with the hopping foot. Stepping on a line "
+    "loses your turn. After all rounds, throw the stone backwards to claim a 'home'. Mostly "
+    "played by girls in schoolyards and streets; a beloved part of Sudanese childhood.\n"
+    "Only talk about Hejla; for anything else say: \"" + OFF_TOPIC_REPLY + "\"\n\n"
+)
+
+_QUICK_SYSTEM = _PERSONA + (
+    "Answer in 1-3 short sentences, then ask one short question back. No drawings."
+)
+
+_EXPLAIN_SYSTEM = _PERSONA + (
+    "Explain what was asked in small, friendly chunks (no walls of text) and end with a "
+    "question to keep chatting.\n"
+    "Board drawings: NEVER draw ASCII art yourself. When explaining squares or hopping, put "
+    "[[board]] on its own line and the app draws it. Options: stone=N puts the stone in "
+    "square N, path shows the hop back, homes=N,M marks homes, e.g. [[board stone=3 path]]. "
+    "One drawing per answer."
+)
+
+SYSTEM_PROMPTS = {QUICK: _QUICK_SYSTEM, EXPLAIN: _EXPLAIN_SYSTEM}
+
+
+def build_prompt(intent):
+    """The chat prompt template for a model-answered intent"""
+    from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+
+    return ChatPromptTemplate.from_messages(
+        [
+            ("system", SYSTEM_PROMPTS[intent]),
+            # Conversation memory (see memory.py); left out when the question stands alone
+            MessagesPlaceholder("history", optional=True),
+            ("human", "{question}"),
+        ]
+    )
+
+
+def build_context(question, user_level="novice", history=None):
+    """Template inputs. The name stays out of the prompt (it is filled in locally),
+    so answers can be shared between users by the cache and single-flight.
+    """
+    context = {"question": question, "user_level": user_level}
+    if history:
+        context["history"] = history
+    return context
+
+
+def scope(intent, user_level="novice"):
+    """Answers can only be shared between questions asked with the same prompt variant"""
+    return f"{intent}:{user_level}"
+
+
+# Folds old turns into a session's rolling summary (memory.py)
+SUMMARY_SYSTEM = (
+    "You keep a short running summary of a chat between Zola, a friendly guide to Hejla "
+    "(Sudanese hopscotch), and a player. Merge the new turns into the summary: what the player "
+    "asked about, what they already know or struggled with, and anything they told about "
+    "themselves. Drop greetings and small talk. At most {words} words, plain sentences, "
+    "reply with the summary only."
+)
+
+
+def build_summary_prompt():
+    """The prompt template for folding turns into a summary"""
+    from langchain_core.prompts import ChatPromptTemplate
+
+    return ChatPromptTemplate.from_messages(
+        [
+            ("system", SUMMARY_SYSTEM),
+            ("human", "Summary so far: {summary}\n\nNew turns:\n{turns}"),
+        ]
+    )
@@ -0,0 +1,69 @@
+// Whole quiz in one element: answers are checked here and the score is posted back once
+import { useState } from "react";
+import { Button } from "@/components/ui/button";
+
+export default function Quiz() {
+  const questions = props.questions || [];
+  const [answers, setAnswers] = useState({});
+  const [submitted, setSubmitted] = useState(false);
+
+  const answered = questions.filter((q) => q.id in answers).length;
+  const score = questions.filter((q) => answers[q.id] === q.correct).length;
+
+  const choose = (question, index) => {
+    if (submitted || question.id in answers) return;
+    const next = { ...answers, [question.id]: index };
+    setAnswers(next);
+
+    // Last answer in: one callback with everything the server needs
+    if (Object.keys(next).length === questions.length) {
+      setSubmitted(true);
+      callAction({ name: "quiz_submit", payload: { answers: next } });
+    }
+  };
+
+  const optionVariant = (question, index) => {
+    if (!(question.id in answers)) return "outline";
+    if (index === question.correct) return "default";
+    return answers[question.id] === index ? "destructive" : "outline";
+  };
+
+  return (
+    <div className="flex flex-col gap-4 w-full">
+      {questions.map((question, n) => (
+        <div key={question.id} className="flex flex-col gap-2">
+          <div className="font-semibold">
+            Question {n + 1}! 🤔 {question.question}
+          </div>
+          <div className="flex flex-wrap gap-2">
+            {question.options.map((option, index) => (
+              <Button
+                key={index}
+                size="sm"
+                variant={optionVariant(question, index)}
+                disabled={question.id in answers}
+                onClick={() => choose(question, index)}
+              >
+                {option}
+              </Button>
+            ))}
+          </div>
+          {question.id in answers && (
+            <div className="text-sm text-muted-foreground">
+              {answers[question.id] === question.correct ? (
+                "Yes! Nailed it! 🎯"
+              ) : (
+                <span>
+                  Ah, close! It's actually <strong>{question.options[question.correct]}</strong> 😅
+                </span>
+              )}
+            </div>
+          )}
+        </div>
+      ))}
+      <div className="text-sm text-muted-foreground">
+        {submitted ? `Score: ${score}/${questions.length} 🏆` : `${answered}/${questions.length} answered`}
+      </div>
+    </div>
+  );
+}
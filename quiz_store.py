@@ -0,0 +1,106 @@
+# Quiz bank loaded from quiz_questions.json and indexed by (category, level)
+import json
+import os
+import random
+import time
+from collections import defaultdict
+import settings
+from loopwatch import log
+
+# Question levels a user may see, by user level
+LEVELS_FOR_USER = {
+    "novice": ("novice", "beginner"),
+    "beginner": ("novice", "beginner"),
+    "intermediate": ("novice", "beginner", "intermediate"),
+    "advanced": ("novice", "beginner", "intermediate", "advanced"),
+}
+
+
+class QuizStore:
+    """Quiz questions with stable IDs and precomputed (category, level) indexes.
+
+    The file is re-read when its modification time changes (checked at most
+    every `reload_interval` seconds), so questions can be edited without a
+    restart.
+    """
+
+    def __init__(self, path, reload_interval=5.0):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._by_id = {}
+        self._index = {}
+        self._mtime = None
+        self._checked = 0.0
+        self.load()
+
+    def load(self):
+        """(Re)load the question file and rebuild the indexes"""
+        mtime = os.stat(self.path).st_mtime
+        with open(self.path, encoding="utf-8") as f:
+            questions = json.load(f)["questions"]
+
+        by_id = {}
+        index = defaultdict(list)
+        for q in questions:
+            q.setdefault("level", "novice")
+            by_id[q["id"]] = q
+            index[(q.get("category", ""), q["level"])].append(q["id"])
+
+        # Swap in complete structures so readers never see a half-built index
+        self._by_id = by_id
+        self._index = {key: tuple(ids) for key, ids in index.items()}
+        self._mtime = mtime
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked < self.reload_interval:
+            return
+        self._checked = now
+        try:
+            if os.stat(self.path).st_mtime != self._mtime:
+                self.load()
+        except (OSError, ValueError, KeyError) as e:
+            # Keep serving the last good bank if the file is mid-edit or broken
+            log(f"Error reloading quiz questions: {e}")
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def get(self, question_id):
+        """Look up one question by ID (None if it no longer exists)"""
+        self._maybe_reload()
+        return self._by_id.get(question_id)
+
+    def _buckets(self, categories, levels):
+        return [ids for (category, level), ids in self._index.items()
+                if (categories is None or category in categories)
+                and (levels is None or level in levels)]
+
+    def sample(self, categories, user_level="novice", count=3):
+        """Pick up to `count` random question IDs for these categories and user level.
+
+        Falls back to any level in the categories, then to the whole bank,
+        like the original linear filters did.
+        """
+        self._maybe_reload()
+        levels = LEVELS_FOR_USER.get(user_level, LEVELS_FOR_USER["novice"])
+
+        buckets = (self._buckets(categories, levels)
+                   or self._buckets(categories, None)
+                   or self._buckets(None, None))
+        total = sum(len(ids) for ids in buckets)
+
+        # Sample positions across the buckets instead of concatenating them
+        selected = []
+        for position in sorted(random.sample(range(total), min(count, total))):
+            for ids in buckets:
+                if position < len(ids):
+                    selected.append(ids[position])
+                    break
+                position -= len(ids)
+        random.shuffle(selected)
+        return selected
+
+
+# Shared quiz bank for the whole process
+quiz_store = QuizStore(settings.QUIZ_FILE, reload_interval=settings.QUIZ_RELOAD_INTERVAL)
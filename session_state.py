@@ -0,0 +1,144 @@
+# Compact per-session state: one __slots__ object instead of loose user_session keys
+import sys
+import chainlit as cl
+import settings
+from session_store import get_store
+from loopwatch import log
+
+# Key under which the state object lives in cl.user_session
+SESSION_KEY = "state"
+
+
+class SessionState:
+    """Everything Zola remembers about one chat.
+
+    Shared things (the chain, images, quiz questions) live at process level;
+    sessions only keep small values, quiz question IDs, the last few
+    (question, answer) turns and a short summary of older ones (memory.py).
+    """
+
+    __slots__ = ("user_name", "user_level", "waiting_for_name",
+                 "quiz_ids", "quiz_index", "quiz_score", "quiz_topic", "history", "summary")
+
+    def __init__(self, user_name="friend", user_level="novice", waiting_for_name=True,
+                 quiz_ids=(), quiz_index=0, quiz_score=0, quiz_topic="", history=(), summary=""):
+        self.user_name = user_name
+        self.user_level = user_level
+        self.waiting_for_name = waiting_for_name
+        self.quiz_ids = tuple(quiz_ids)
+        self.quiz_index = quiz_index
+        self.quiz_score = quiz_score
+        self.quiz_topic = quiz_topic
+        self.history = [tuple(turn) for turn in history]
+        self.summary = summary
+
+    @property
+    def quiz_total(self):
+        return len(self.quiz_ids)
+
+    def start_quiz(self, question_ids, topic):
+        self.quiz_ids = tuple(question_ids)
+        self.quiz_index = 0
+        self.quiz_score = 0
+        self.quiz_topic = topic
+
+    def add_turn(self, question, answer):
+        """Remember a finished turn, keeping only the most recent ones"""
+        self.history.append((question, answer))
+        del self.history[:-settings.SESSION_HISTORY_TURNS]
+
+    def to_dict(self):
+        data = {name: getattr(self, name) for name in self.__slots__}
+        data["quiz_ids"] = list(self.quiz_ids)
+        data["history"] = [list(turn) for turn in self.history]
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{name: data[name] for name in cls.__slots__ if name in data})
+
+
+def get_state():
+    """The current session's state (created on first access)"""
+    state = cl.user_session.get(SESSION_KEY)
+    if state is None:
+        state = SessionState()
+        cl.user_session.set(SESSION_KEY, state)
+    return state
+
+
+def session_key():
+    """Stable key for the conversation: the user if logged in, else the chat thread"""
+    user = cl.user_session.get("user")
+    if user is not None and getattr(user, "identifier", None):
+        return f"user:{user.identifier}"
+    return f"thread:{cl.context.session.thread_id}"
+
+
+async def restore():
+    """Load this conversation's state from the session store (a fresh one if unknown)"""
+    try:
+        data = await get_store().get(session_key())
+    except Exception as e:
+        log(f"Error loading session: {e}")
+        data = None
+    state = SessionState.from_dict(data) if data else SessionState()
+    cl.user_session.set(SESSION_KEY, state)
+    return state
+
+
+async def save():
+    """Write the current state back so another worker (or a restart) can pick it up"""
+    try:
+        await get_store().put(session_key(), get_state().to_dict(), ttl=settings.SESSION_TTL)
+    except Exception as e:
+        log(f"Error saving session: {e}")
+
+
+def deep_size(obj, seen=None):
+    """Approximate bytes held by an object and everything it references"""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in obj)
+    elif hasattr(obj, "__slots__"):
+        size += sum(deep_size(getattr(obj, name, None), seen) for name in obj.__slots__)
+    elif hasattr(obj, "__dict__"):
+        size += deep_size(vars(obj), seen)
+    return size
+
+
+def memory_report():
+    """Bytes per session: our state object and the whole Chainlit user_session dict"""
+    from chainlit.user_session import user_sessions
+
+    sessions = list(user_sessions.values())
+    state_bytes = [deep_size(s[SESSION_KEY]) for s in sessions if SESSION_KEY in s]
+    session_bytes = [deep_size(s) for s in sessions]
+    count = len(sessions)
+    return {
+        "sessions": count,
+        "state_bytes_total": sum(state_bytes),
+        "state_bytes_per_session": round(sum(state_bytes) / len(state_bytes), 1) if state_bytes else 0,
+        "user_session_bytes_total": sum(session_bytes),
+        "user_session_bytes_per_session": round(sum(session_bytes) / count, 1) if count else 0,
+    }
+
+
+def install_report(app, path="/debug/sessions"):
+    """Serve the memory report as JSON ahead of Chainlit's catch-all route"""
+    from starlette.responses import JSONResponse
+    from starlette.routing import Route
+
+    async def report(request):
+        return JSONResponse(memory_report())
+
+    # Already there if this module was re-imported by a reload
+    if any(getattr(route, "path", None) == path for route in app.router.routes):
+        return
+    app.router.routes.insert(0, Route(path, report, methods=["GET"]))
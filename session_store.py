@@ -0,0 +1,255 @@
+# Pluggable session backends so sessions survive restarts and can be shared between workers
+import abc
+import asyncio
+import json
+import sqlite3
+import time
+from urllib.parse import urlparse
+import settings
+from loopwatch import log
+
+
+class SessionStore(abc.ABC):
+    """Stores one JSON-able dict per session key, with an expiry in seconds"""
+
+    @abc.abstractmethod
+    async def get(self, key):
+        ...
+
+    @abc.abstractmethod
+    async def put(self, key, data, ttl=None):
+        ...
+
+    @abc.abstractmethod
+    async def delete(self, key):
+        ...
+
+    async def close(self):
+        pass
+
+
+class MemoryStore(SessionStore):
+    """Process-local store (the old behaviour; lost on restart)"""
+
+    def __init__(self):
+        self._data = {}
+
+    async def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires, raw = entry
+        if expires is not None and expires < time.time():
+            del self._data[key]
+            return None
+        return json.loads(raw)
+
+    async def put(self, key, data, ttl=None):
+        # Stored as JSON so callers never share mutable objects with the store
+        self._data[key] = (time.time() + ttl if ttl else None, json.dumps(data))
+
+    async def delete(self, key):
+        self._data.pop(key, None)
+
+
+class SQLiteStore(SessionStore):
+    """Single-file store for several worker processes on one machine (or one Fly volume).
+
+    Queries are tiny, so they run on a worker thread with one connection
+    per call; WAL mode lets the processes read while another one writes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS sessions "
+                       "(key TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def _get(self, key):
+        with self._connect() as db:
+            row = db.execute("SELECT data, expires FROM sessions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] is not None and row[1] < time.time():
+                db.execute("DELETE FROM sessions WHERE key = ?", (key,))
+                return None
+            return json.loads(row[0])
+
+    def _put(self, key, data, ttl):
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO sessions (key, data, expires) VALUES (?, ?, ?)",
+                       (key, json.dumps(data), time.time() + ttl if ttl else None))
+
+    def _delete(self, key):
+        with self._connect() as db:
+            db.execute("DELETE FROM sessions WHERE key = ?", (key,))
+
+    async def get(self, key):
+        return await asyncio.to_thread(self._get, key)
+
+    async def put(self, key, data, ttl=None):
+        await asyncio.to_thread(self._put, key, data, ttl)
+
+    async def delete(self, key):
+        await asyncio.to_thread(self._delete, key)
+
+
+class RedisError(Exception):
+    """Error reply from the Redis server"""
+
+
+def encode_command(*args):
+    """Encode a command as a RESP array of bulk strings"""
+    parts = [f"*{len(args)}\r\n".encode()]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(parts)
+
+
+async def read_reply(reader):
+    """Read one RESP reply"""
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("connection closed by server")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest.decode()
+    if kind == b"-":
+        raise RedisError(rest.decode())
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        length = int(rest)
+        if length == -1:
+            return None
+        data = await reader.readexactly(length + 2)
+        return data[:-2]
+    if kind == b"*":
+        count = int(rest)
+        if count == -1:
+            return None
+        return [await read_reply(reader) for _ in range(count)]
+    raise RedisError(f"unexpected reply {line!r}")
+
+
+class RedisStore(SessionStore):
+    """Store for several machines, speaking the Redis protocol directly.
+
+    Works with Redis, Valkey, Upstash or anything RESP-compatible (see
+    bench/fake_redis.py for a local stand-in). Commands share one connection
+    and are sent one at a time; it reconnects once if the connection drops.
+    """
+
+    def __init__(self, url, prefix="zola:session:"):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.username = parsed.username
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.ssl = parsed.scheme == "rediss"
+        self.prefix = prefix
+        self._reader = None
+        self._writer = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl or None)
+        try:
+            if self.password:
+                auth = ("AUTH", self.username, self.password) if self.username else ("AUTH", self.password)
+                await self._send(*auth)
+            if self.db:
+                await self._send("SELECT", self.db)
+        except RedisError:
+            # Don't keep an unauthenticated (or wrong-db) connection around for later calls
+            await self._drop()
+            raise
+
+    async def _send(self, *args):
+        try:
+            self._writer.write(encode_command(*args))
+            await self._writer.drain()
+            return await read_reply(self._reader)
+        except RedisError:
+            # A whole error reply was read, so the connection is still in step
+            raise
+        except BaseException:
+            # Cancelled (or failed) mid-exchange: this command's reply may still be
+            # on its way and would be read as the next command's, so never reuse it
+            await self._drop()
+            raise
+
+    async def execute(self, *args):
+        """Run one command and return its reply"""
+        async with self._lock:
+            for attempt in (1, 2):
+                try:
+                    if self._writer is None:
+                        await self._connect()
+                    return await self._send(*args)
+                except (ConnectionError, asyncio.IncompleteReadError, OSError):
+                    await self._drop()
+                    if attempt == 2:
+                        raise
+
+    async def _drop(self):
+        # Forget the connection first, so it's gone even if we're cancelled while closing
+        writer = self._writer
+        self._reader = self._writer = None
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    async def get(self, key):
+        raw = await self.execute("GET", self.prefix + key)
+        return None if raw is None else json.loads(raw)
+
+    async def put(self, key, data, ttl=None):
+        args = ("SET", self.prefix + key, json.dumps(data))
+        await self.execute(*(args + ("EX", int(ttl)) if ttl else args))
+
+    async def delete(self, key):
+        await self.execute("DEL", self.prefix + key)
+
+    async def close(self):
+        async with self._lock:
+            await self._drop()
+
+
+def build_store(kind=None):
+    """Create the backend named by SESSION_STORE (memory, sqlite or redis)"""
+    kind = (kind or settings.SESSION_STORE).lower()
+    if kind == "sqlite":
+        return SQLiteStore(settings.SESSION_DB_PATH)
+    if kind == "redis":
+        return RedisStore(settings.REDIS_URL)
+    if kind != "memory":
+        log(f"Unknown SESSION_STORE {kind!r}, using memory")
+    return MemoryStore()
+
+
+_store = None
+
+
+def get_store():
+    """The process-wide session store (created on first use)"""
+    global _store
+    if _store is None:
+        _store = build_store()
+    return _store
+
+
+async def close_store():
+    global _store
+    if _store is not None:
+        await _store.close()
+        _store = None
@@ -0,0 +1,150 @@
+# Runtime settings for Zola, read from the environment (and .env)
+import importlib
+import os
+import sys
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def _int(name, default):
+    """Read an integer setting, falling back to the default"""
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _float(name, default):
+    """Read a float setting, falling back to the default"""
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _bool(name, default):
+    """Read an on/off setting ("1", "true", "yes", "on" count as on)"""
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Shared Cohere HTTP client (one keep-alive pool for every chat session)
+COHERE_MAX_CONNECTIONS = _int("COHERE_MAX_CONNECTIONS", 20)
+COHERE_MAX_KEEPALIVE_CONNECTIONS = _int("COHERE_MAX_KEEPALIVE_CONNECTIONS", 10)
+COHERE_KEEPALIVE_EXPIRY = _float("COHERE_KEEPALIVE_EXPIRY", 30.0)
+COHERE_TIMEOUT = _float("COHERE_TIMEOUT", 60.0)
+# Point at another Cohere-compatible endpoint (e.g. bench/fake_cohere.py)
+COHERE_BASE_URL = os.environ.get("COHERE_BASE_URL") or os.environ.get("CO_API_URL")
+# Chat model; empty asks the endpoint for its default chat model when the chain is built
+COHERE_MODEL = os.environ.get("COHERE_MODEL", "")
+
+# Answer cache for repeated (suggestion) questions
+ANSWER_CACHE_ENABLED = _bool("ANSWER_CACHE_ENABLED", True)
+ANSWER_CACHE_SIZE = _int("ANSWER_CACHE_SIZE", 256)
+ANSWER_CACHE_TTL = _float("ANSWER_CACHE_TTL", 6 * 60 * 60)
+ANSWER_CACHE_SIMILARITY = _float("ANSWER_CACHE_SIMILARITY", 0.9)
+
+# Token streaming: "buffered" coalesces chunks into fewer websocket emits, "direct" sends each one
+STREAM_MODE = os.environ.get("STREAM_MODE", "buffered")
+STREAM_FLUSH_INTERVAL = _float("STREAM_FLUSH_INTERVAL", 0.05)
+STREAM_FLUSH_BYTES = _int("STREAM_FLUSH_BYTES", 256)
+
+# Quiz bank file (hot-reloaded when it changes)
+QUIZ_FILE = os.environ.get("QUIZ_FILE", "quiz_questions.json")
+QUIZ_RELOAD_INTERVAL = _float("QUIZ_RELOAD_INTERVAL", 5.0)
+# "element" sends the whole quiz in one custom element, scored in the browser and posted
+# back once; "buttons" is the old one-question-per-round-trip flow
+QUIZ_MODE = os.environ.get("QUIZ_MODE", "element").lower()
+QUIZ_LENGTH = _int("QUIZ_LENGTH", 3)
+
+# Cold start: "background" warms up after the server is listening, "blocking"
+# before it accepts connections, "off" builds everything on first use
+WARMUP_MODE = os.environ.get("WARMUP_MODE", "background")
+
+# Admission control for LLM streams
+LLM_MAX_INFLIGHT = _int("LLM_MAX_INFLIGHT", 8)
+LLM_USER_RATE_PER_MIN = _float("LLM_USER_RATE_PER_MIN", 10)
+LLM_USER_BURST = _int("LLM_USER_BURST", 4)
+LLM_MAX_QUEUE_WAIT = _float("LLM_MAX_QUEUE_WAIT", 30.0)
+
+# Hedging: "openai" races OpenAI when Cohere has no first token after HEDGE_AFTER seconds
+HEDGE_PROVIDER = os.environ.get("HEDGE_PROVIDER", "none")
+HEDGE_AFTER = _float("HEDGE_AFTER", 2.0)
+OPENAI_MODEL = os.environ.get("OPENAI_MODEL", "gpt-4o-mini")
+OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL")
+BREAKER_THRESHOLD = _int("BREAKER_THRESHOLD", 3)
+BREAKER_RESET_AFTER = _float("BREAKER_RESET_AFTER", 30.0)
+
+# Serve bytes-per-session numbers on /debug/sessions (off in production)
+SESSION_REPORT = _bool("SESSION_REPORT", False)
+
+# Where sessions are kept: "memory" (one process), "sqlite" (one machine) or "redis" (many)
+SESSION_STORE = os.environ.get("SESSION_STORE", "memory")
+SESSION_DB_PATH = os.environ.get("SESSION_DB_PATH", "sessions.db")
+REDIS_URL = os.environ.get("REDIS_URL", "redis://127.0.0.1:6379/0")
+SESSION_TTL = _int("SESSION_TTL", 7 * 24 * 3600)
+# Upper bound on stored turns (verbatim window plus turns waiting to be summarized)
+SESSION_HISTORY_TURNS = _int("SESSION_HISTORY_TURNS", 10)
+
+# Conversation memory: "auto" (only for questions that refer back), "always" or "off";
+# the last MEMORY_TURNS turns go in verbatim within MEMORY_TOKEN_BUDGET, older ones are
+# folded MEMORY_FOLD_TURNS at a time into a summary of at most MEMORY_SUMMARY_TOKENS,
+# in the background and only when MEMORY_HEADROOM LLM slots stay free
+MEMORY_MODE = os.environ.get("MEMORY_MODE", "auto").lower()
+MEMORY_TURNS = _int("MEMORY_TURNS", 4)
+MEMORY_TOKEN_BUDGET = _int("MEMORY_TOKEN_BUDGET", 1000)
+MEMORY_FOLD_TURNS = _int("MEMORY_FOLD_TURNS", 3)
+MEMORY_SUMMARY_TOKENS = _int("MEMORY_SUMMARY_TOKENS", 150)
+MEMORY_HEADROOM = _int("MEMORY_HEADROOM", 2)
+
+# Identical questions streaming at the same time share one upstream request
+SINGLE_FLIGHT_ENABLED = _bool("SINGLE_FLIGHT_ENABLED", True)
+
+# Tracing: "full" (every turn, with Chainlit steps), "sampled", "errors" or "off";
+# failed turns and turns slower than TRACE_SLOW_AFTER are always kept unless off
+TRACE_MODE = os.environ.get("TRACE_MODE", "sampled")
+TRACE_SAMPLE_PERCENT = _float("TRACE_SAMPLE_PERCENT", 5.0)
+TRACE_SLOW_AFTER = _float("TRACE_SLOW_AFTER", 8.0)
+TRACE_FILE = os.environ.get("TRACE_FILE", "traces.jsonl")
+TRACE_BATCH_SIZE = _int("TRACE_BATCH_SIZE", 50)
+TRACE_FLUSH_INTERVAL = _float("TRACE_FLUSH_INTERVAL", 2.0)
+
+# Speculative prefetch of the offered follow-ups (off by default: it spends tokens on guesses)
+PREFETCH_ENABLED = _bool("PREFETCH_ENABLED", False)
+PREFETCH_SESSION_TOKENS = _int("PREFETCH_SESSION_TOKENS", 1500)
+PREFETCH_GLOBAL_TOKENS_PER_MIN = _int("PREFETCH_GLOBAL_TOKENS_PER_MIN", 20000)
+PREFETCH_CONCURRENCY = _int("PREFETCH_CONCURRENCY", 2)
+# Slots left free for real questions before a prefetch may start
+PREFETCH_HEADROOM = _int("PREFETCH_HEADROOM", 2)
+
+# Output caps per question intent (0 = no cap) and local answers for off-topic questions
+MAX_TOKENS_QUICK = _int("MAX_TOKENS_QUICK", 160)
+MAX_TOKENS_EXPLAIN = _int("MAX_TOKENS_EXPLAIN", 600)
+LOCAL_DEFLECTION = _bool("LOCAL_DEFLECTION", True)
+
+# Event-loop watchdog: probe interval, when a block counts as a stall (stack captured),
+# /debug/loop report, and moving known blocking work (quiz file, logging) to threads
+LOOP_WATCH = _bool("LOOP_WATCH", True)
+LOOP_PROBE_INTERVAL = _float("LOOP_PROBE_INTERVAL", 0.1)
+LOOP_STALL_THRESHOLD = _float("LOOP_STALL_THRESHOLD", 0.25)
+LOOP_REPORT = _bool("LOOP_REPORT", False)
+BLOCKING_OFFLOAD = _bool("BLOCKING_OFFLOAD", True)
+
+# Conversation persistence (Chainlit data layer): "sqlite" or "none", and the write-behind
+# queue that keeps disk writes off the turn (bounded; full means writes are dropped)
+DATA_LAYER = os.environ.get("DATA_LAYER", "sqlite").lower()
+DATA_DB_PATH = os.environ.get("DATA_DB_PATH", "conversations.db")
+DATA_BATCH_SIZE = _int("DATA_BATCH_SIZE", 200)
+DATA_FLUSH_INTERVAL = _float("DATA_FLUSH_INTERVAL", 0.5)
+DATA_MAX_QUEUE = _int("DATA_MAX_QUEUE", 20000)
+# How long shutdown waits for queued writes to reach disk
+DATA_SHUTDOWN_TIMEOUT = _float("DATA_SHUTDOWN_TIMEOUT", 10.0)
+
+
+def reload():
+    """Re-read every setting from the environment (e.g. after editing .env)"""
+    load_dotenv(override=True)
+    importlib.reload(sys.modules[__name__])
@@ -0,0 +1,123 @@
+# Single-flight: identical questions asked at the same time share one upstream stream
+import asyncio
+
+
+class Flight:
+    """One upstream stream whose chunks are buffered and fanned out to every follower.
+
+    The stream is pumped by a background task, so a follower leaving doesn't
+    stop it for the others; it is cancelled only once nobody is following.
+    `on_release` is called when the upstream stops, whoever is still following
+    (e.g. to give back the LLM slot the stream was started with).
+    """
+
+    def __init__(self, key, stream, on_done=None, on_release=None):
+        self.key = key
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.followers = 0
+        # True once the upstream was stopped because every follower left
+        self.cancelled = False
+        self._changed = asyncio.Event()
+        self._on_done = on_done
+        self._on_release = on_release
+        self._task = asyncio.ensure_future(self._pump(stream))
+
+    async def _pump(self, stream):
+        try:
+            async for chunk in stream:
+                self.chunks.append(chunk)
+                self._wake()
+        except asyncio.CancelledError:
+            self.error = asyncio.CancelledError()
+            raise
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._wake()
+            if self._on_release is not None:
+                self._on_release()
+            if self._on_done is not None:
+                self._on_done(self)
+
+    def _wake(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self):
+        """Yield every chunk from the start: late joiners first get the buffered prefix"""
+        self.followers += 1
+        index = 0
+        try:
+            while True:
+                if index < len(self.chunks):
+                    chunk = self.chunks[index]
+                    index += 1
+                    yield chunk
+                elif self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                else:
+                    await self._changed.wait()
+        finally:
+            self.followers -= 1
+            if self.followers == 0 and not self.done:
+                # Everyone left (disconnected or superseded): stop paying for the stream
+                self.cancelled = True
+                self._task.cancel()
+
+
+class SingleFlight:
+    """Registry of in-flight streams keyed by normalized prompt"""
+
+    def __init__(self):
+        self._flights = {}
+        # How many followers joined an existing flight instead of starting one
+        self.joined = 0
+
+    def get(self, key):
+        """The flight currently streaming for `key`, if any"""
+        flight = self._flights.get(key)
+        # A cancelled flight stays registered until its pump task winds down;
+        # joining it would only replay a prefix and then the cancellation
+        if flight is None or flight.cancelled:
+            return None
+        return flight
+
+    def start(self, key, stream, on_release=None):
+        """Return the flight for `key`, starting one on `stream` if none is running.
+
+        If another request started the same flight meanwhile, `stream` is
+        closed unused, `on_release` is called right away and the existing
+        flight is returned.
+        """
+        flight = self.get(key)
+        if flight is not None:
+            asyncio.ensure_future(stream.aclose())
+            if on_release is not None:
+                on_release()
+            self.joined += 1
+            return flight
+        flight = self._flights[key] = Flight(key, stream, on_done=self._finished, on_release=on_release)
+        return flight
+
+    def join(self, key):
+        """Join the running flight for `key` (None if there isn't one)"""
+        flight = self.get(key)
+        if flight is not None:
+            self.joined += 1
+        return flight
+
+    def _finished(self, flight):
+        if self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+
+    def __len__(self):
+        return len(self._flights)
+
+
+# Shared registry for the whole process
+single_flight = SingleFlight()
@@ -0,0 +1,115 @@
+"""Cold-start helpers: warm-up hook and an import-time profile report.
+
+Run `python startup.py` to see where start-up time goes:
+
+    python startup.py              # import-time breakdown of app.py + warm-up timings
+    python startup.py --top 40     # show more modules
+"""
+import argparse
+import asyncio
+import re
+import subprocess
+import sys
+import time
+from collections import defaultdict
+import settings
+from loopwatch import log
+
+# Holds a reference so the background warm-up task isn't garbage collected
+_warm_up_task = None
+
+
+def _timed(label, fn, timings):
+    start = time.perf_counter()
+    fn()
+    timings[label] = time.perf_counter() - start
+
+
+def warm_up_sync():
+    """Import the LLM stack, build the shared chain and prepare images"""
+    import agent
+    import assets
+
+    timings = {}
+    _timed("build runnable", agent.get_runnable, timings)
+    _timed("load assets", assets.load_assets, timings)
+    return timings
+
+
+async def warm_up():
+    """Run the warm-up in a worker thread so the event loop stays responsive"""
+    try:
+        timings = await asyncio.to_thread(warm_up_sync)
+        log("Warm-up done: " + ", ".join(f"{k} {v * 1000:.0f} ms" for k, v in timings.items()))
+    except Exception as e:
+        # Not fatal: everything is built again on first use
+        log(f"Error during warm-up: {e}")
+
+
+async def on_startup():
+    """App start-up hook, honouring WARMUP_MODE"""
+    global _warm_up_task
+    if settings.WARMUP_MODE == "blocking":
+        await warm_up()
+    elif settings.WARMUP_MODE == "background":
+        _warm_up_task = asyncio.create_task(warm_up())
+
+
+_IMPORTTIME_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def profile_imports(module="app"):
+    """Import a module in a fresh interpreter with -X importtime and parse the report.
+
+    Returns (total seconds, {top-level package: total self seconds},
+    [(module, self seconds), ...]).
+    """
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True,
+    )
+    total = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    packages = defaultdict(float)
+    modules = []
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if not match:
+            continue
+        self_us, _, _, name = match.groups()
+        modules.append((name, int(self_us) / 1e6))
+        # Packages are mostly imported deep inside other imports (app -> agent -> langchain),
+        # so sum each module's own time under its top-level package name
+        packages[name.split(".")[0]] += int(self_us) / 1e6
+    return total, dict(packages), modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Start-up profile report")
+    parser.add_argument("--module", default="app", help="module to import (default: app)")
+    parser.add_argument("--top", type=int, default=20, help="rows per table")
+    parser.add_argument("--no-warm-up", action="store_true", help="skip timing the warm-up")
+    args = parser.parse_args()
+
+    total, packages, modules = profile_imports(args.module)
+    print(f"import {args.module}: {total * 1000:.0f} ms wall (fresh interpreter)\n")
+
+    print("Top-level packages by import time (self time of all their modules):")
+    for name, seconds in sorted(packages.items(), key=lambda kv: -kv[1])[:args.top]:
+        print(f"  {seconds * 1000:8.1f} ms  {name}")
+
+    print("\nSlowest individual modules (self time):")
+    for name, seconds in sorted(modules, key=lambda kv: -kv[1])[:args.top]:
+        print(f"  {seconds * 1000:8.1f} ms  {name}")
+
+    if not args.no_warm_up:
+        print("\nWarm-up (first-use work the hook moves off the request path):")
+        for label, seconds in warm_up_sync().items():
+            print(f"  {seconds * 1000:8.1f} ms  {label}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# Coalesce streamed tokens into fewer websocket emits
+import asyncio
+import time
+import settings
+
+
+class TokenCoalescer:
+    """Buffer chunks for a cl.Message and flush them in batches.
+
+    The first chunk is sent straight away to keep time-to-first-token low.
+    After that, text is flushed once `interval` seconds have passed since the
+    last emit or the buffer reaches `max_bytes`, whichever comes first. A
+    timer makes sure buffered text still goes out if the model stalls.
+    """
+
+    def __init__(self, message, interval=None, max_bytes=None, mode=None, gate=None):
+        self.message = message
+        # Awaited before the first emit, so messages meant to appear above this one go first
+        self._gate = gate
+        self.interval = settings.STREAM_FLUSH_INTERVAL if interval is None else interval
+        self.max_bytes = settings.STREAM_FLUSH_BYTES if max_bytes is None else max_bytes
+        self.buffered = (mode or settings.STREAM_MODE) == "buffered"
+        self._buffer = []
+        self._size = 0
+        self._last_flush = None
+        self._timer = None
+        self._lock = asyncio.Lock()
+        self._replace_next = False
+        # Number of stream_token calls (websocket emits) for this answer
+        self.emits = 0
+        self.chunks = 0
+
+    async def push(self, chunk):
+        """Add a chunk, flushing if the policy says so"""
+        if not chunk:
+            return
+        self.chunks += 1
+        if not self.buffered:
+            await self._emit(chunk)
+            return
+
+        self._buffer.append(chunk)
+        self._size += len(chunk.encode())
+        now = time.monotonic()
+        if (self._last_flush is None
+                or self._size >= self.max_bytes
+                or now - self._last_flush >= self.interval):
+            await self.flush()
+        elif self._timer is None:
+            delay = self.interval - (now - self._last_flush)
+            self._timer = asyncio.get_running_loop().call_later(delay, self._flush_later)
+
+    def _flush_later(self):
+        self._timer = None
+        if self._buffer:
+            asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        """Send whatever is buffered as a single token"""
+        async with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._buffer:
+                return
+            text = "".join(self._buffer)
+            self._buffer.clear()
+            self._size = 0
+            await self._emit(text)
+
+    async def _wait_gate(self):
+        if self._gate is not None:
+            await self._gate
+            self._gate = None
+
+    async def placeholder(self, text):
+        """Show temporary text that the first real flush will replace"""
+        await self._wait_gate()
+        await self.message.stream_token(text, is_sequence=True)
+        self.emits += 1
+        self._replace_next = True
+
+    async def _emit(self, text):
+        await self._wait_gate()
+        await self.message.stream_token(text, is_sequence=self._replace_next)
+        self._replace_next = False
+        self.emits += 1
+        self._last_flush = time.monotonic()
+
+    def discard(self):
+        """Drop buffered text and stop the flush timer (the turn was abandoned)"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._buffer.clear()
+        self._size = 0
+
+    async def close(self):
+        """Flush the remainder (call before message.send())"""
+        await self.flush()
+        await self._wait_gate()
@@ -0,0 +1,39 @@
+# Import smoke tests: module-level setup (histograms, routes, shared instances) must not raise
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Chainlit's OpenTelemetry exporters would otherwise try to ship spans at exit
+os.environ.setdefault("OTEL_SDK_DISABLED", "true")
+
+
+def test_metrics_import():
+    import metrics
+
+    for buckets in (metrics.FAST_BUCKETS, metrics.SLOW_BUCKETS, metrics.SEND_BUCKETS):
+        assert list(buckets) == sorted(set(buckets))
+
+
+def test_app_import():
+    import app
+
+    assert app.stream_answer
+
+
+def test_app_reimport():
+    # `chainlit run -w` drops the app's modules and imports them again after an edit
+    import app
+    from chainlit.server import app as server_app
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    routes = len(server_app.router.routes)
+    middleware = len(server_app.user_middleware)
+    for name, module in list(sys.modules.items()):
+        if os.path.dirname(getattr(module, "__file__", None) or "") == root:
+            del sys.modules[name]
+
+    import app as reloaded
+
+    assert reloaded is not app
+    assert len(server_app.router.routes) == routes
+    assert len(server_app.user_middleware) == middleware
@@ -0,0 +1,42 @@
+# Redis session store against the fake server in bench/
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.fake_redis import FakeRedis, start  # noqa: E402
+from session_store import RedisStore  # noqa: E402
+
+
+def test_cancelled_command_does_not_leak_its_reply():
+    async def scenario():
+        fake = FakeRedis()
+        server = await start(fake, port=0)
+        port = server.sockets[0].getsockname()[1]
+        store = RedisStore(f"redis://127.0.0.1:{port}/0")
+        try:
+            await store.put("a", {"name": "a"})
+
+            # Cancel a write after it's sent but before its reply arrives
+            fake.delay = 0.2
+            put = asyncio.ensure_future(store.put("b", {"name": "b"}))
+            await asyncio.sleep(0.05)
+            put.cancel()
+            try:
+                await put
+            except asyncio.CancelledError:
+                pass
+            fake.delay = 0.0
+
+            # Each reply goes to its own command (before the fix, get("b") returned a's state)
+            assert await store.get("a") == {"name": "a"}
+            assert await store.get("b") in (None, {"name": "b"})
+            await asyncio.sleep(0.2)
+            assert await store.get("b") == {"name": "b"}
+        finally:
+            await store.close()
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(scenario())
@@ -0,0 +1,48 @@
+# Single-flight registry: followers share one stream, and nobody joins a dying one
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from singleflight import SingleFlight  # noqa: E402
+
+
+async def _tokens(count, delay=0.01):
+    for n in range(count):
+        await asyncio.sleep(delay)
+        yield f"t{n}"
+
+
+async def _collect(flight):
+    return [chunk async for chunk in flight.follow()]
+
+
+def test_followers_share_one_stream():
+    async def scenario():
+        flights = SingleFlight()
+        first = flights.start("q", _tokens(3))
+        second = flights.join("q")
+        assert second is first
+        assert await asyncio.gather(_collect(first), _collect(second)) == [["t0", "t1", "t2"]] * 2
+        assert len(flights) == 0
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_flight_is_not_joined():
+    async def scenario():
+        flights = SingleFlight()
+        flight = flights.start("q", _tokens(5))
+        follower = flight.follow()
+        assert await follower.__anext__() == "t0"
+        # The last follower leaves: the pump is cancelled but hasn't wound down yet
+        await follower.aclose()
+        assert flight.cancelled and len(flights) == 1
+
+        assert flights.join("q") is None
+        fresh = flights.start("q", _tokens(2))
+        assert fresh is not flight
+        assert await _collect(fresh) == ["t0", "t1"]
+
+    asyncio.run(scenario())
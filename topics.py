@@ -0,0 +1,123 @@
+# Topic classification shared by every keyword router in app.py
+import re
+from functools import lru_cache
+from typing import FrozenSet, NamedTuple, Optional
+
+# keyword -> (topic, quiz category); keywords match at the start of a word,
+# so "hopping" and "squares" count but "shop" and "online" don't
+KEYWORDS = {
+    "play": ("gameplay", "rules"),
+    "rules": ("gameplay", "rules"),
+    "how to": ("gameplay", "rules"),
+    "hop": ("gameplay", "gameplay"),
+    "history": ("history", None),
+    "origin": ("history", None),
+    "past": ("history", None),
+    "traditional": ("history", "culture"),
+    "tradition": ("culture", "culture"),
+    "culture": ("culture", "culture"),
+    "cultural": ("culture", "culture"),
+    "girls": ("culture", "culture"),
+    "childhood": ("culture", None),
+    "square": ("setup", "rules"),
+    "ground": ("setup", None),
+    "chalk": ("setup", "equipment"),
+    "draw": ("setup", None),
+    "stone": (None, "equipment"),
+    "home": ("winning", "strategy"),
+    "win": ("winning", "strategy"),
+    "strategy": ("winning", "strategy"),
+    "line": (None, "gameplay"),
+}
+
+# When several topics match, the first one in this list wins
+TOPIC_PRIORITY = ["gameplay", "history", "culture", "setup", "winning"]
+
+# topic -> (friendly description, image key, follow-up set)
+TOPICS = {
+    "gameplay": ("Hejla gameplay and rules", "rules", "gameplay"),
+    "history": ("the history of Hejla", "history", "culture"),
+    "culture": ("the cultural significance of Hejla", "cultural", "culture"),
+    "setup": ("how to set up Hejla", "rules", "basics"),
+    "winning": ("Hejla rules and winning", "rules", "strategy"),
+    "general": ("Hejla", None, "basics"),
+}
+
+# Image key -> caption used when the picture is sent on its own
+IMAGE_CAPTIONS = {
+    "rules": "the squares and rules",
+    "cultural": "how girls play it",
+    "history": "where Hejla comes from",
+}
+
+ALL_QUIZ_CATEGORIES = frozenset({"rules", "gameplay", "culture", "equipment", "strategy", "social"})
+
+# Follow-up suggestion sets: (question, button label)
+FOLLOW_UPS = {
+    "gameplay": [
+        ("How do you draw the squares for Hejla?", "Drawing squares"),
+        ("What's the hopping technique in Hejla?", "Hopping tips"),
+        ("Can boys play Hejla too?", "Who can play?"),
+    ],
+    "culture": [
+        ("Why is Hejla important in Sudanese culture?", "Cultural impact"),
+        ("Where do girls usually play Hejla?", "Play locations"),
+        ("Is Hejla played in other countries too?", "Regional variations"),
+    ],
+    "strategy": [
+        ("How do you create a 'home' in Hejla?", "Creating homes"),
+        ("What rules can you make for your home?", "Home rules"),
+        ("What's the best strategy to win?", "Winning tips"),
+    ],
+    "basics": [
+        ("How do you play Hejla step by step?", "Basic rules"),
+        ("What do you need to play Hejla?", "Equipment needed"),
+        ("Can Hejla be played indoors?", "Playing locations"),
+    ],
+}
+
+# One regex for every keyword, longest first so "traditional" beats "tradition"
+_MATCHER = re.compile(
+    r"\b(?:" + "|".join(re.escape(k) for k in sorted(KEYWORDS, key=len, reverse=True)) + r")"
+)
+
+
+class TopicMatch(NamedTuple):
+    topic: str
+    description: str
+    image_key: Optional[str]
+    quiz_categories: FrozenSet[str]
+    follow_up_set: str
+    keywords: FrozenSet[str]
+
+    @property
+    def wants_drawing(self):
+        """Rules and setup answers come with a drawing"""
+        return self.topic in ("gameplay", "setup")
+
+
+@lru_cache(maxsize=1024)
+def classify(text):
+    """Scan the text once and work out topic, image, quiz categories and follow-ups"""
+    keywords = frozenset(m.group(0) for m in _MATCHER.finditer(text.lower()))
+
+    topics = set()
+    categories = set()
+    for keyword in keywords:
+        topic, category = KEYWORDS[keyword]
+        if topic:
+            topics.add(topic)
+        if category:
+            categories.add(category)
+
+    topic = next((t for t in TOPIC_PRIORITY if t in topics), "general")
+    description, image_key, follow_up_set = TOPICS[topic]
+
+    return TopicMatch(
+        topic=topic,
+        description=description,
+        image_key=image_key,
+        quiz_categories=frozenset(categories) or ALL_QUIZ_CATEGORIES,
+        follow_up_set=follow_up_set,
+        keywords=keywords,
+    )
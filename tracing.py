@@ -0,0 +1,199 @@
+# Sampled turn tracing: cheap per-turn records, kept by mode, exported in background batches
+import asyncio
+import json
+import random
+import time
+import chainlit as cl
+import settings
+from batching import run_batches
+from loopwatch import log
+
+MODES = ("full", "sampled", "errors", "off")
+
+
+class TurnTrace:
+    """What happened during one turn; the tracer keeps or drops it when the turn ends"""
+
+    __slots__ = ("handler", "topic", "question", "session_id", "sampled", "started", "start", "spans")
+
+    def __init__(self, handler, topic, question, session_id, sampled):
+        self.handler = handler
+        self.topic = topic
+        self.question = question
+        self.session_id = session_id
+        # Head-sampled turns also record per-run spans of the chain
+        self.sampled = sampled
+        self.started = time.time()
+        self.start = time.perf_counter()
+        self.spans = []
+
+
+_recorder_class = None
+
+
+def span_recorder(trace):
+    """LangChain callback recording chain/model runs (not tokens) into trace.spans.
+
+    Defined on first use so importing this module doesn't pull in LangChain.
+    """
+    global _recorder_class
+    if _recorder_class is None:
+        from langchain_core.callbacks import BaseCallbackHandler
+
+        class SpanRecorder(BaseCallbackHandler):
+            run_inline = True
+
+            def __init__(self, trace):
+                self.trace = trace
+                self._open = {}
+
+            def _start(self, run_id, parent_run_id, name):
+                self._open[run_id] = {
+                    "name": name, "run_id": str(run_id),
+                    "parent": str(parent_run_id) if parent_run_id else None,
+                    "start": round(time.perf_counter() - self.trace.start, 4),
+                }
+
+            def _end(self, run_id, error=None):
+                span = self._open.pop(run_id, None)
+                if span is not None:
+                    span["end"] = round(time.perf_counter() - self.trace.start, 4)
+                    if error is not None:
+                        span["error"] = repr(error)
+                    self.trace.spans.append(span)
+
+            def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+                self._start(run_id, parent_run_id, kwargs.get("name") or (serialized or {}).get("name", "chain"))
+
+            def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+                self._start(run_id, parent_run_id, kwargs.get("name") or (serialized or {}).get("name", "model"))
+
+            def on_chain_end(self, outputs, *, run_id, **kwargs):
+                self._end(run_id)
+
+            def on_llm_end(self, response, *, run_id, **kwargs):
+                self._end(run_id)
+
+            def on_chain_error(self, error, *, run_id, **kwargs):
+                self._end(run_id, error)
+
+            def on_llm_error(self, error, *, run_id, **kwargs):
+                self._end(run_id, error)
+
+        _recorder_class = SpanRecorder
+    return _recorder_class(trace)
+
+
+class Tracer:
+    """Decides which turns to keep and writes them out without blocking turns.
+
+    Modes: "full" keeps every turn and also shows Chainlit's step UI (the old
+    behaviour, for local debugging); "sampled" keeps `sample_percent`% of
+    turns; "errors" keeps only failed turns; "off" records nothing. In every
+    mode but "off", failed turns and turns slower than `slow_after` seconds
+    are kept. Kept traces go to a bounded queue and are appended to a JSONL
+    file in batches by a background task.
+    """
+
+    def __init__(self, mode="sampled", sample_percent=5.0, slow_after=8.0, path="traces.jsonl",
+                 batch_size=50, flush_interval=2.0, max_queue=1000):
+        if mode not in MODES:
+            log(f"Unknown TRACE_MODE {mode!r}, using sampled")
+            mode = "sampled"
+        self.mode = mode
+        self.sample_percent = sample_percent
+        self.slow_after = slow_after
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self._queue = None
+        self._worker = None
+        self.kept = 0
+        self.dropped = 0
+
+    def start_turn(self, handler, topic, question, session_id=None):
+        """Begin a turn; None when tracing is off"""
+        if self.mode == "off":
+            return None
+        sampled = self.mode == "full" or (self.mode == "sampled" and random.random() * 100 < self.sample_percent)
+        return TurnTrace(handler, topic, question, session_id, sampled)
+
+    def callbacks(self, trace):
+        """LangChain callbacks for this turn (none unless it was sampled)"""
+        if trace is None or not trace.sampled:
+            return []
+        callbacks = [span_recorder(trace)]
+        if self.mode == "full":
+            callbacks.append(cl.LangchainCallbackHandler())
+        return callbacks
+
+    def finish(self, trace, error=None, **fields):
+        """End a turn and queue it for export if it should be kept"""
+        if trace is None:
+            return
+        total = time.perf_counter() - trace.start
+        slow = total >= self.slow_after
+        if not (trace.sampled or error is not None or slow):
+            return
+        record = {
+            "time": trace.started, "handler": trace.handler, "topic": trace.topic,
+            "session": trace.session_id, "question": trace.question, "total": round(total, 4),
+            "kept_because": "error" if error is not None else ("slow" if slow else "sampled"),
+            "spans": trace.spans,
+        }
+        if error is not None:
+            record["error"] = repr(error)
+        record.update(fields)
+        self._enqueue(record)
+
+    def _enqueue(self, record):
+        if self._queue is None:
+            self._queue = asyncio.Queue(self.max_queue)
+            self._worker = asyncio.ensure_future(self._run())
+        try:
+            self._queue.put_nowait(record)
+            self.kept += 1
+        except asyncio.QueueFull:
+            # Never slow a turn down for tracing: drop instead
+            self.dropped += 1
+
+    async def _run(self):
+        await run_batches(self._queue, self.batch_size, self.flush_interval, self._export, self._write)
+
+    async def _export(self, batch):
+        try:
+            await asyncio.to_thread(self._write, batch)
+        except Exception as e:
+            log(f"Error writing traces: {e}")
+
+    def _write(self, batch):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(json.dumps(record, default=str) + "\n" for record in batch)
+
+    async def close(self):
+        """Stop the exporter and write whatever is still queued"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        if self._queue is not None:
+            batch = []
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            if batch:
+                await self._export(batch)
+
+
+# Shared tracer for the whole process
+tracer = Tracer(
+    mode=settings.TRACE_MODE,
+    sample_percent=settings.TRACE_SAMPLE_PERCENT,
+    slow_after=settings.TRACE_SLOW_AFTER,
+    path=settings.TRACE_FILE,
+    batch_size=settings.TRACE_BATCH_SIZE,
+    flush_interval=settings.TRACE_FLUSH_INTERVAL,
+)